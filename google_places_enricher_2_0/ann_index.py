@@ -0,0 +1,200 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+ANN_INDEX_PATH = "./static/data/input/enrichment_categories.ann.npz"
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def phrases_fingerprint(model_name, phrases):
+    """
+    Identifies the model and phrases an index was built from.
+    """
+    digest = hashlib.sha256(model_name.encode("utf-8"))
+    for phrase in phrases:
+        digest.update(b"\0" + str(phrase).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class IVFIndex:
+    """
+    Inverted file index over normalized embeddings, for approximate top-k
+    cosine similarity search.
+
+    The vectors are partitioned into `n_lists` clusters with spherical
+    k-means. A query is only scored against the vectors of the `n_probe`
+    clusters whose centroids are the most similar to it, so raising
+    `n_probe` trades speed for recall.
+
+    Parameters
+    ----------
+    vectors: numpy.ndarray
+        The N x D embeddings, normalized.
+    centroids: numpy.ndarray
+        The n_lists x D centroids of the clusters.
+    ids: numpy.ndarray
+        The row of each vector, grouped by cluster.
+    offsets: numpy.ndarray
+        Start of every cluster in `ids`, plus the total number of vectors.
+    fingerprint: str
+        Identifies the phrases the index was built from.
+    n_lists: int
+        Number of clusters requested when the index was built, 0 for automatic.
+    """
+
+    def __init__(self, vectors, centroids, ids, offsets, fingerprint="", n_lists=0):
+        self.vectors = vectors
+        self.centroids = centroids
+        self.ids = ids
+        self.offsets = offsets
+        self.fingerprint = fingerprint
+        self.n_lists = n_lists
+
+    @classmethod
+    def build(cls, vectors, n_lists=0, iterations=10, seed=0, fingerprint=""):
+        """
+        Clusters the vectors with spherical k-means and builds the index.
+
+        Parameters
+        ----------
+        vectors: numpy.ndarray
+            The N x D embeddings.
+        n_lists: int
+            Number of clusters, about 4 * sqrt(N) when 0.
+        iterations: int
+            Number of k-means iterations.
+        seed: int
+            Seed of the initial centroids, so builds are reproducible.
+        fingerprint: str
+            Identifies the phrases the index is built from.
+
+        Returns
+        -------
+        IVFIndex
+            The index.
+        """
+        vectors = normalize(vectors)
+        requested_lists = n_lists
+        n_lists = n_lists or int(4 * np.sqrt(len(vectors)))
+        n_lists = max(1, min(n_lists, len(vectors)))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = cls._assign(vectors, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            empty = np.bincount(assignment, minlength=n_lists) == 0
+            # Empty clusters keep their previous centroid
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+        assignment = cls._assign(vectors, centroids)
+        ids = np.argsort(assignment, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+        return cls(vectors, centroids, ids, offsets, fingerprint, requested_lists)
+
+    @staticmethod
+    def _assign(vectors, centroids, block=8192):
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), block):
+            assignment[start:start + block] = np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+        return assignment
+
+    def search(self, queries, k, n_probe=8):
+        """
+        Finds the approximate top-k most similar vectors of each query.
+
+        Parameters
+        ----------
+        queries: numpy.ndarray
+            The Q x D query embeddings.
+        k: int
+            Number of neighbours per query.
+        n_probe: int
+            Number of clusters scored per query.
+
+        Returns
+        -------
+        numpy.ndarray, numpy.ndarray
+            The Q x k rows of the neighbours and their cosine similarities, by descending similarity.
+        """
+        queries = normalize(queries)
+        k = min(k, len(self.vectors))
+        n_probe = max(1, min(n_probe, len(self.centroids)))
+        centroid_scores = queries @ self.centroids.T
+        probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+        sizes = np.diff(self.offsets)
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            if sizes[lists].sum() < k:
+                # Too few vectors in the probed clusters, the next closest ones are added
+                ranked = np.argsort(-centroid_scores[row])
+                lists = ranked[:np.searchsorted(np.cumsum(sizes[ranked]), k) + 1]
+            candidates = np.concatenate([self.ids[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+            candidate_scores = self.vectors[candidates] @ query
+            best = np.argpartition(-candidate_scores, k - 1)[:k]
+            best = best[np.argsort(-candidate_scores[best], kind="stable")]
+            indices[row] = candidates[best]
+            scores[row] = candidate_scores[best]
+        return indices, scores
+
+    def save(self, path=ANN_INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, vectors=self.vectors, centroids=self.centroids, ids=self.ids,
+                     offsets=self.offsets, fingerprint=np.array(self.fingerprint),
+                     n_lists=np.array(self.n_lists))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=ANN_INDEX_PATH):
+        with np.load(path) as data:
+            # Files written before n_lists was stored never match a setting
+            n_lists = int(data["n_lists"]) if "n_lists" in data else -1
+            return cls(data["vectors"], data["centroids"], data["ids"], data["offsets"],
+                       str(data["fingerprint"]), n_lists)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_ann_index(fingerprint, vectors, n_lists=0, path=ANN_INDEX_PATH):
+    """
+    Returns the index of the category embeddings, loading it from `path` or
+    building and saving it when the phrases or the number of clusters changed.
+
+    Parameters
+    ----------
+    fingerprint: str
+        Identifies the model and phrases of `vectors`, see phrases_fingerprint.
+    vectors: numpy.ndarray
+        The category embeddings, used only when the index has to be built.
+    n_lists: int
+        Number of clusters of a new index, automatic when 0.
+
+    Returns
+    -------
+    IVFIndex
+        The index.
+    """
+    global _index
+    with _index_lock:
+        if _index is not None and (_index.fingerprint, _index.n_lists) == (fingerprint, n_lists):
+            return _index
+        if os.path.exists(path):
+            index = IVFIndex.load(path)
+            if (index.fingerprint, index.n_lists) == (fingerprint, n_lists):
+                _index = index
+                return _index
+        print(f"Building the category index of {len(vectors)} phrases...")
+        _index = IVFIndex.build(vectors, n_lists=n_lists, fingerprint=fingerprint)
+        _index.save(path)
+        return _index
@@ -1,14 +1,22 @@
 from flask import Flask, render_template, request, redirect, url_for, jsonify
 from google_places_enricher_2_0.flows import calculate_coordinates, request_google_places
-from google_places_enricher_2_0.utils import create_estab_phrase, calculate_similarity_sentences
+from google_places_enricher_2_0.grid import TILINGS
+from google_places_enricher_2_0.utils import (
+    build_establishment_phrases,
+    calculate_similarity_sentences,
+    intern_estab_phrases
+)
 from werkzeug.utils import secure_filename
 import pandas as pd
-import numpy as np
 import csv
 import os
 import argparse
 import datetime
 from google_places_enricher_2_0.config import get_config_value, set_config_value
+from google_places_enricher_2_0.dataset_io import read_dataset, write_dataset
+from google_places_enricher_2_0.embedding_store import extend_embeddings
+from google_places_enricher_2_0.jobs import FINISHED, get_job_manager
+from google_places_enricher_2_0.models import warm_up_model
 
 app = Flask(__name__)
 
@@ -30,7 +38,7 @@ def view_data():
     try:
         csv_path = 'static/data/output/establishments.csv'
         try:
-            data = pd.read_csv(csv_path)
+            data = read_dataset(csv_path)
         except FileNotFoundError:
             return f"Error: File {csv_path} not found."
         except Exception as e:
@@ -116,10 +124,23 @@ def get_categories():
 
     return jsonify({'categories': categories})
 
+def run_enrichment(job, resume=False, max_pages=None, adaptive=False):
+    result = request_google_places(resume=resume, max_pages=max_pages, adaptive=adaptive, job=job)
+    print(f"Result from request_google_places: {result}")
+
+    if not result:
+        raise RuntimeError("Google Places API returned no response")
+    if "successfully" not in result.lower():
+        raise RuntimeError(result)
+    return {"message": "CSV updated successfully"}
+
 @app.route('/update_categories_and_process_data', methods=['POST'])
 def update_categories_and_process_data():
     data = request.get_json()
     categories = data.get('categories')
+    resume = bool(data.get('resume', False))
+    max_pages = data.get('max_pages')
+    adaptive = bool(data.get('adaptive', False))
 
     if not categories:
         return jsonify({"error": "No categories provided"}), 400 
@@ -129,27 +150,28 @@ def update_categories_and_process_data():
     try:
         print(f"Received categories: {categories}")
 
+        # Two runs would overwrite each other's checkpoint and output
+        running = get_job_manager().active('enrichment')
+        if running:
+            return jsonify({"error": "An enrichment is already running", "job_id": running[0].id}), 409
+
         with open(csv_file_path, mode='w', newline='') as file:
             writer = csv.writer(file, delimiter=';')
             writer.writerow(['category'])
             for cat in categories:
                 writer.writerow(cat) 
         
-        result = request_google_places()
-        print(f"Result from request_google_places: {result}")
-
-        if not result:
-            return jsonify({"error": "Google Places API returned no response"}), 500
-        if "successfully" not in result.lower():
-            return jsonify({"error": result}), 500
-
-        return jsonify({"message": "CSV updated successfully"}), 200 
+        job = get_job_manager().submit('enrichment', run_enrichment, resume=resume, max_pages=max_pages, adaptive=adaptive)
+        return jsonify({
+            "message": "Enrichment started",
+            "job_id": job.id,
+            "status_url": url_for('job_status', job_id=job.id)
+        }), 202
 
     except Exception as e:
         print(f"Exception occurred: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-
 @app.route("/calculate_coordinates", methods=["POST"])
 def calculate_coordinates_route():
     data = request.get_json()
@@ -158,9 +180,17 @@ def calculate_coordinates_route():
     southwest_lon = data.get("southwestLon")
     northeast_lat = data.get("northeastLat")
     northeast_lon = data.get("northeastLon")
-    result = calculate_coordinates(
-        radius, southwest_lat, southwest_lon, northeast_lat, northeast_lon
-    )
+    # The tiling of the last calculation is kept as the default
+    tiling = data.get("tiling") or get_config_value("TILING")
+    area = data.get("polygon")
+    if tiling not in TILINGS:
+        return jsonify({"error": f"Invalid tiling. Expected one of: {', '.join(TILINGS)}"}), 400
+    try:
+        result = calculate_coordinates(
+            radius, southwest_lat, southwest_lon, northeast_lat, northeast_lon, tiling=tiling, area=area
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     return jsonify(result)
 
@@ -263,6 +293,7 @@ def enrichment_categories():
 
     csv_file_path = 'static/data/input/enrichment_categories.csv'
 
+    phrases = []
     try:
         os.makedirs(os.path.dirname(csv_file_path), exist_ok=True)
         with open(csv_file_path, mode='w', newline='', encoding='utf-8') as file:
@@ -274,10 +305,14 @@ def enrichment_categories():
                 category = cat.get('category', '')
                 phrase = cat.get('matching_phrase', '') or category
                 writer.writerow([category, phrase])
+                phrases.append(phrase)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    # Encode the new or edited phrases ahead of the next matching request
+    extend_embeddings(phrases)
+
     return jsonify({'message': 'Categories updated successfully.'}), 200
 
 @app.route('/get_available_datasets', methods=['GET'])
@@ -330,6 +365,38 @@ def upload_dataset():
 def match_categories():
     return render_template('match_categories.html')
 
+def run_categories_matching(job, enrichment_file, dataset_full_path):
+    df_enrichment = pd.read_csv(enrichment_file, delimiter=';')
+    if 'matching_phrase' not in df_enrichment.columns:
+        df_enrichment['matching_phrase'] = df_enrichment['category']
+
+    google_data = read_dataset(dataset_full_path)
+    df_estab_phrases, _ = intern_estab_phrases(google_data)
+
+    # Unique, multi-word establishment phrases, so each one is encoded once
+    df_estab = df_estab_phrases.drop_duplicates(subset='phrase_id')[['phrase_establishment', 'category']]
+    df_estab = df_estab[df_estab['phrase_establishment'].astype(str).str.contains(' ', regex=False)].reset_index(drop=True)
+
+    # Use pandas to ensure all relevant columns are strings
+    estab_phrases = df_estab['phrase_establishment'].astype(str).tolist()
+    estab_categories = df_estab['category'].astype(str).tolist()
+    yelp_phrases = df_enrichment['matching_phrase'].astype(str).tolist()
+    yelp_categories_col = df_enrichment['category'].astype(str).tolist()
+
+    # Build yelp_categories as array of [category, phrase]
+    yelp_categories = [[cat, phr] for cat, phr in zip(yelp_categories_col, yelp_phrases)]
+
+    # Calculate similarities
+    sim_df = calculate_similarity_sentences(estab_phrases, yelp_phrases, job=job)
+
+    # Build establishment_phrases as per spec
+    establishment_phrases = build_establishment_phrases(estab_categories, estab_phrases, sim_df)
+
+    return {
+        "establishment_phrases": establishment_phrases,
+        "yelp_categories": yelp_categories
+    }
+
 @app.route('/get_categories_to_match', methods=['GET'])
 def get_categories_to_match():
     try:
@@ -337,70 +404,73 @@ def get_categories_to_match():
         if not os.path.exists(enrichment_file):
             return jsonify({'error': 'Enrichment categories file not found'}), 404
 
-        df_enrichment = pd.read_csv(enrichment_file, delimiter=';')
-        if 'matching_phrase' not in df_enrichment.columns:
-            df_enrichment['matching_phrase'] = df_enrichment['category']
-
         dataset_path = request.args.get('dataset_path', 'establishments.csv')
         dataset_full_path = os.path.join('static/data/output', dataset_path)
         if not os.path.exists(dataset_full_path):
             return jsonify({'error': f'Dataset {dataset_path} not found'}), 404
 
-        google_data = pd.read_csv(dataset_full_path)
-        df_estab_phrases = create_estab_phrase(google_data)
-
-        # Filter unique, multi-word establishment phrases
-        df_estab = (
-            df_estab_phrases
-            .drop_duplicates(subset="phrase_establishment")[['phrase_establishment', 'category']]
-            .assign(words_phrase_estab=lambda df: df['phrase_establishment'].apply(lambda phrase: len(str(phrase).split(' '))))
-        )
-        df_estab = df_estab[df_estab['words_phrase_estab'] > 1].reset_index(drop=True)
-
-        # Use pandas to ensure all relevant columns are strings
-        estab_phrases = df_estab['phrase_establishment'].astype(str).tolist()
-        estab_categories = df_estab['category'].astype(str).tolist()
-        yelp_phrases = df_enrichment['matching_phrase'].astype(str).tolist()
-        yelp_categories_col = df_enrichment['category'].astype(str).tolist()
-
-        # Build yelp_categories as array of [category, phrase]
-        yelp_categories = [[cat, phr] for cat, phr in zip(yelp_categories_col, yelp_phrases)]
-
-        # Calculate similarities
-        sim_df = calculate_similarity_sentences(estab_phrases, yelp_phrases)
-
-        # Build establishment_phrases as per spec
-        establishment_phrases = []
-        for estab_idx, (category, phrase) in enumerate(zip(estab_categories, estab_phrases)):
-            matches = sim_df[sim_df.estab_idx == estab_idx]
-            options = []
-            for row in matches.itertuples(index=False):
-                score = float(row.score)
-                if not pd.notnull(score) or not np.isfinite(score):
-                    score = -1.0
-                options.append({"category_index": int(row.yelp_idx), "score": score})
-            options_sorted = sorted(options, key=lambda x: x['score'], reverse=True)
-            best_score = options_sorted[0]['score'] if options_sorted else -1.0
-            selected_option = 0 if options_sorted else None
-            selected_score = options_sorted[0]['score'] if options_sorted else -1.0
-            establishment_phrases.append({
-                "category": category,
-                "phrase": phrase,
-                "best_score": best_score,
-                "selected_score": selected_score,
-                "selected_option": selected_option,
-                "options": options_sorted
-            })
-
-        response_data = {
-            "establishment_phrases": establishment_phrases,
-            "yelp_categories": yelp_categories
-        }
-        return jsonify(response_data)
+        # The matching runs in the background, its result is read from /jobs/<job_id>/result
+        job = get_job_manager().submit('matching', run_categories_matching, enrichment_file, dataset_full_path)
+        return jsonify({
+            "job_id": job.id,
+            "status_url": url_for('job_status', job_id=job.id),
+            "result_url": url_for('job_result', job_id=job.id)
+        }), 202
     except Exception as e:
         print(f"Error in get_categories_to_match: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify({'jobs': get_job_manager().store.list()})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = get_job_manager().status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    manager = get_job_manager()
+    status = manager.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if status['status'] != 'succeeded':
+        return jsonify({'error': f"Job is {status['status']}", 'status': status['status']}), 409
+    return jsonify(manager.result(job_id))
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    manager = get_job_manager()
+    status = manager.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if status['status'] in FINISHED or not manager.cancel(job_id):
+        return jsonify({'error': f"Job is {status['status']}", 'status': status['status']}), 409
+    return jsonify({'message': 'Cancellation requested'}), 202
+
+MATCH_COLUMNS = ['matched_phrase', 'category_index', 'matched_category', 'selected_score', 'best_score']
+
+def _phrase_match(establishment_phrase, yelp_categories):
+    """
+    Returns the MATCH_COLUMNS values of an establishment phrase object, all None without one.
+    """
+    matched_phrase = establishment_phrase['phrase'] if establishment_phrase else None
+    selected_option = establishment_phrase['selected_option'] if establishment_phrase and 'selected_option' in establishment_phrase and establishment_phrase['selected_option'] is not None and establishment_phrase['selected_option'] >= 0 else None
+    selected_score = None
+    best_score = establishment_phrase['best_score'] if establishment_phrase else None
+    category_index = None
+    matched_category = None
+    if establishment_phrase and selected_option is not None and isinstance(establishment_phrase.get('options'), list) and selected_option < len(establishment_phrase['options']):
+        selected_opt = establishment_phrase['options'][selected_option]
+        selected_score = selected_opt['score']
+        category_index = selected_opt['category_index']
+        if category_index is not None and category_index < len(yelp_categories):
+            matched_category = yelp_categories[category_index][0]
+    return matched_phrase, category_index, matched_category, selected_score, best_score
+
 @app.route('/export_enriched_dataset', methods=['POST'])
 def export_enriched_dataset():
     try:
@@ -411,48 +481,33 @@ def export_enriched_dataset():
         dataset_full_path = os.path.join('static/data/output', dataset_path)
         if not os.path.exists(dataset_full_path):
             return jsonify({'error': f'Dataset {dataset_path} not found'}), 404
-        df = pd.read_csv(dataset_full_path)
+        df = read_dataset(dataset_full_path)
         # Try to find the phrase column
         phrase_col = None
         for col in ['phrase', 'phrase_establishment', 'matching_phrase']:
             if col in df.columns:
                 phrase_col = col
                 break
-        # If not found, generate it using create_estab_phrase
+        # If not found, generate it from the unique category and types combinations
         if not phrase_col:
-            df_phrases = create_estab_phrase(df)
-            df = df.merge(df_phrases, on='place_id', how='left')
+            df_phrases, _ = intern_estab_phrases(df)
+            df = df.merge(df_phrases.drop(columns='phrase_id'), on='place_id', how='left')
             phrase_col = 'phrase_establishment'
         # Build phrase -> establishment_phrase object lookup
         phrase_to_obj = {ep['phrase']: ep for ep in establishment_phrases}
-        enriched_rows = []
-        for idx, row in df.iterrows():
-            phrase_val = row[phrase_col]
-            establishment_phrases = phrase_to_obj.get(str(phrase_val)) if pd.notnull(phrase_val) else None
-            matched_phrase = establishment_phrases['phrase'] if establishment_phrases else None
-            selected_option = establishment_phrases['selected_option'] if establishment_phrases and 'selected_option' in establishment_phrases and establishment_phrases['selected_option'] is not None and establishment_phrases['selected_option'] >= 0 else None
-            selected_score = None
-            best_score = establishment_phrases['best_score'] if establishment_phrases else None
-            category_index = None
-            matched_category = None
-            if establishment_phrases and selected_option is not None and isinstance(establishment_phrases.get('options'), list) and selected_option < len(establishment_phrases['options']):
-                selected_opt = establishment_phrases['options'][selected_option]
-                selected_score = selected_opt['score']
-                category_index = selected_opt['category_index']
-                if category_index is not None and category_index < len(yelp_categories):
-                    matched_category = yelp_categories[category_index][0]
-            enriched_row = row.to_dict()
-            enriched_row['matched_phrase'] = matched_phrase
-            enriched_row['category_index'] = category_index
-            enriched_row['matched_category'] = matched_category
-            enriched_row['selected_score'] = selected_score
-            enriched_row['best_score'] = best_score
-            enriched_rows.append(enriched_row)
-        df_enriched = pd.DataFrame(enriched_rows)
+        # The match of each unique phrase is resolved once and broadcast to its rows,
+        # rows without a phrase get the id -1, i.e. the last match
+        phrase_ids, unique_phrases = pd.factorize(df[phrase_col])
+        matches = [_phrase_match(phrase_to_obj.get(str(phrase)), yelp_categories) for phrase in unique_phrases]
+        matches.append(_phrase_match(None, yelp_categories))
+        df_matches = pd.DataFrame(matches, columns=MATCH_COLUMNS).iloc[phrase_ids]
+        df_enriched = df.reset_index(drop=True)
+        for col in MATCH_COLUMNS:
+            df_enriched[col] = df_matches[col].to_numpy()
         now = datetime.datetime.now()
         out_name = f"enriched_{now.strftime('%Y%m%d_%H%M%S')}.csv"
         out_path = os.path.join('static/data/output', out_name)
-        df_enriched.to_csv(out_path, index=False)
+        write_dataset(df_enriched, out_path)
         download_url = url_for('static', filename=f'data/output/{out_name}')
         return jsonify({'download_url': download_url})
     except Exception as e:
@@ -462,5 +517,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Run the Flask application')
     parser.add_argument('--port', type=int, default=5000, help='Port to run the application on')
     args = parser.parse_args()
-    
+
+    if get_config_value("MODEL_WARM_UP"):
+        warm_up_model()
     app.run(host='127.0.0.1', port=args.port)
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+
+CHECKPOINT_PATH = "./static/data/output/request_checkpoint.jsonl"
+
+
+def unit_key(lat, lon, cat):
+    """
+    Builds the key identifying a (lat, lon, category) search unit in the checkpoint.
+    """
+    return "{:.7f};{:.7f};{}".format(float(lat), float(lon), cat)
+
+
+class RunCheckpoint:
+    """
+    Append-only JSONL journal of the search units completed by an enrichment run.
+
+    Each line holds the response of one (lat, lon, category) unit and
+    is flushed to disk as soon as the unit finishes, so a crashed or
+    interrupted run can be resumed without paying for those requests again.
+
+    Parameters
+    ----------
+    path: str
+        Path of the checkpoint file.
+    resume: bool
+        Keeps the units already in the file instead of starting a new journal.
+    """
+
+    def __init__(self, path=CHECKPOINT_PATH, resume=False):
+        self.path = path
+        # Responses loaded from a previous run, dropped as soon as they are reused
+        self.completed = self.load() if resume else {}
+        self.checkpointed = set(self.completed)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Reads the units stored in the checkpoint file.
+
+        Returns
+        -------
+        dict
+            The response of each completed unit, by unit key.
+        """
+        completed = {}
+        if not os.path.exists(self.path):
+            return completed
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Line cut short by a crash while it was being written
+                    continue
+                completed[entry["key"]] = {
+                    "places": entry["places"],
+                    "nextPageToken": entry.get("nextPageToken"),
+                    # Journals written before the flag only saturated on a leftover token
+                    "saturated": entry.get("saturated", bool(entry.get("nextPageToken"))),
+                }
+        return completed
+
+    def get(self, lat, lon, cat):
+        """
+        Returns the response of a completed unit, or None if it still has to be requested.
+
+        Each unit is only searched once per run, so its response is handed
+        over and no longer kept by the checkpoint.
+        """
+        with self._lock:
+            return self.completed.pop(unit_key(lat, lon, cat), None)
+
+    def record(self, lat, lon, cat, response):
+        """
+        Appends a completed unit to the checkpoint and syncs it to disk.
+
+        Only the places, the nextPageToken and the flag telling if the search
+        was saturated are written, and nothing but the unit key stays in memory.
+        """
+        key = unit_key(lat, lon, cat)
+        entry = {
+            "places": response["places"],
+            "nextPageToken": response.get("nextPageToken"),
+            "saturated": response.get("saturated", False),
+        }
+        line = json.dumps({"key": key, **entry}, ensure_ascii=False)
+        with self._lock:
+            self.checkpointed.add(key)
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
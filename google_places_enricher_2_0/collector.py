@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+
+from google_places_enricher_2_0.utils import ESTABLISHMENT_LABELS
+
+
+def _is_missing(value):
+    # None, or NaN, the only value different from itself
+    return value is None or value != value
+
+
+class PlaceCollector:
+    """
+    Deduplicates the establishments of an enrichment run as they are collected.
+
+    Overlapping search circles return the same place many times. Only the
+    first record of each place_id is kept, with its empty fields filled by the
+    later hits and the categories it was found with merged, so memory follows
+    the number of unique places instead of the number of hits. The hits and
+    duplicates of every grid cell are counted to help tuning the radius and
+    the step of the grid.
+
+    Parameters
+    ----------
+    labels: list
+        Names of the fields of the rows, must contain place_id and category.
+    """
+
+    def __init__(self, labels=ESTABLISHMENT_LABELS):
+        self.labels = list(labels)
+        self._place_id = self.labels.index("place_id")
+        self._category = self.labels.index("category")
+        self.places = {}
+        self.cells = {}
+        self.hits = 0
+
+    def add(self, rows, cell):
+        """
+        Adds the establishment rows returned by a search around a grid cell.
+
+        Parameters
+        ----------
+        rows: list
+            Tuples with the fields of each establishment, in `labels` order.
+        cell: tuple
+            (lat, lon) center of the search.
+        """
+        hits = duplicates = 0
+        for row in rows:
+            place_id = row[self._place_id]
+            if _is_missing(place_id):
+                continue
+            hits += 1
+            entry = self.places.get(place_id)
+            if entry is None:
+                self.places[place_id] = (list(row), [row[self._category]])
+                continue
+            duplicates += 1
+            record, categories = entry
+            if row[self._category] not in categories:
+                categories.append(row[self._category])
+            for index, value in enumerate(record):
+                if _is_missing(value):
+                    record[index] = row[index]
+        self.hits += hits
+        counts = self.cells.setdefault(cell, [0, 0])
+        counts[0] += hits
+        counts[1] += duplicates
+
+    def to_frame(self):
+        """
+        Builds the establishments table, in the format of establishments.csv.
+
+        Returns
+        -------
+        pandas.core.frame.DataFrame
+            One row per place_id, sorted by place_id, with its unique categories.
+        """
+        place_ids = sorted(self.places)
+        df = pd.DataFrame.from_records(
+            [self.places[place_id][0] for place_id in place_ids], columns=self.labels
+        )
+        df = df.astype({"lat": "float64", "lon": "float64"})
+        fields = ["lat", "lon"] + [column for column in self.labels
+                                   if column not in ("place_id", "opening_hours", "category", "lat", "lon")]
+        df_final = df[["place_id"] + fields]
+        df_final.insert(1, "categories", [np.array(self.places[place_id][1], dtype=object)
+                                          for place_id in place_ids])
+        return df_final
+
+    def cell_report(self):
+        """
+        Summarizes the hits of every grid cell.
+
+        Returns
+        -------
+        pandas.core.frame.DataFrame
+            lat, lon, hits, duplicates and duplicate_ratio of each cell.
+        """
+        report = pd.DataFrame(
+            [(lat, lon, hits, duplicates) for (lat, lon), (hits, duplicates) in self.cells.items()],
+            columns=["lat", "lon", "hits", "duplicates"]
+        )
+        report["duplicate_ratio"] = (report["duplicates"] / report["hits"].where(report["hits"] > 0)).fillna(0.0).round(3)
+        return report
+
+    def stats(self):
+        """
+        Summarizes the deduplication of the run.
+
+        Returns
+        -------
+        dict
+            Number of hits and unique places, overall duplicate ratio and the
+            mean and maximum duplicate ratio of the grid cells.
+        """
+        report = self.cell_report()
+        return {
+            "hits": self.hits,
+            "unique_places": len(self.places),
+            "duplicate_ratio": round(1 - len(self.places) / self.hits, 3) if self.hits else 0.0,
+            "cell_duplicate_ratio_mean": round(float(report["duplicate_ratio"].mean()), 3) if len(report) else 0.0,
+            "cell_duplicate_ratio_max": float(report["duplicate_ratio"].max()) if len(report) else 0.0,
+        }
@@ -1,7 +1,12 @@
 import os
 import json
+import tempfile
+import threading
+import time
 
 CONFIG_PATH = "config.json"
+# Minimum time between two checks of the config file modification time
+CONFIG_CHECK_INTERVAL = 1.0
 DEFAULT_CONFIG = {
     "GOOGLE_MAPS_API": "https://maps.googleapis.com/maps/api",
     "API": "/place",
@@ -12,10 +17,50 @@ DEFAULT_CONFIG = {
     "NORTHEAST_LON": -49.20322728948593,
     "SOUTHWEST_LAT": -25.512242704374355,
     "SOUTHWEST_LON": -49.32304693059921,
-    "API_KEY": ""
+    "API_KEY": "",
+    "TILING": "square",
+    "REQUEST_WORKERS": 4,
+    "REQUESTS_PER_SECOND": 10,
+    "REQUEST_BUDGET": 0,
+    "MAX_RETRIES": 5,
+    "RETRY_BACKOFF_SECONDS": 1.0,
+    "HTTP_POOL_SIZE": 10,
+    "REQUEST_TIMEOUT": 30,
+    "CACHE_ENABLED": True,
+    "CACHE_TTL_SECONDS": 604800,
+    "CACHE_MAX_MB": 256,
+    "MAX_PAGES": 3,
+    "ADAPTIVE_MAX_DEPTH": 3,
+    "PARQUET_OUTPUT": True,
+    "PARQUET_ROW_GROUP_SIZE": 50000,
+    "MODEL_NAME": "all-MiniLM-L6-v2",
+    "MODEL_DEVICE": "",
+    "MODEL_BACKEND": "torch",
+    "MODEL_ONNX_FILE": "",
+    "MODEL_THREADS": 0,
+    "MODEL_WARM_UP": True,
+    "EMBEDDING_CACHE_ENABLED": True,
+    "MATCH_TOP_K": 20,
+    "MATCH_BATCH_SIZE": 1024,
+    "ANN_ENABLED": False,
+    "ANN_MIN_CATEGORIES": 5000,
+    "ANN_LISTS": 0,
+    "ANN_PROBES": 8,
+    "JOB_WORKERS": 2,
+    "JOB_RETENTION": 20
 }
 
-def load_config():
+_cache = {"path": None, "stamp": None, "checked_at": 0.0, "config": None}
+_lock = threading.RLock()
+
+def _file_stamp():
+    try:
+        stat = os.stat(CONFIG_PATH)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def _read_config():
     if not os.path.exists(CONFIG_PATH):
         return DEFAULT_CONFIG.copy()
     with open(CONFIG_PATH) as f:
@@ -25,15 +70,49 @@ def load_config():
         config.setdefault(k, v)
     return config
 
+def _cached_config():
+    # The file is parsed once and only read again when its modification time
+    # or size changes, checked at most every CONFIG_CHECK_INTERVAL seconds.
+    with _lock:
+        now = time.monotonic()
+        if (_cache["config"] is not None and _cache["path"] == CONFIG_PATH
+                and now - _cache["checked_at"] < CONFIG_CHECK_INTERVAL):
+            return _cache["config"]
+        stamp = _file_stamp()
+        if _cache["config"] is None or _cache["path"] != CONFIG_PATH or _cache["stamp"] != stamp:
+            _cache.update(path=CONFIG_PATH, stamp=stamp, config=_read_config())
+        _cache["checked_at"] = now
+        return _cache["config"]
+
+def load_config():
+    return dict(_cached_config())
+
 def save_config(config):
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(config, f, indent=2)
+    # Write to a temporary file and rename it over config.json, so readers
+    # never see a half written file.
+    directory = os.path.dirname(os.path.abspath(CONFIG_PATH))
+    with _lock:
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".config.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(config, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, CONFIG_PATH)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        _cache.update(path=CONFIG_PATH, stamp=_file_stamp(), checked_at=time.monotonic(), config=dict(config))
 
 def get_config_value(key):
-    config = load_config()
-    return config.get(key)
+    return _cached_config().get(key)
+
+def set_config_values(values):
+    with _lock:
+        config = load_config()
+        config.update(values)
+        save_config(config)
 
 def set_config_value(key, value):
-    config = load_config()
-    config[key] = value
-    save_config(config)
+    set_config_values({key: value})
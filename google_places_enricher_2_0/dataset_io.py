@@ -0,0 +1,105 @@
+import os
+
+import pandas as pd
+
+from google_places_enricher_2_0.config import get_config_value
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional
+    pa = pq = None
+
+
+def parquet_path(csv_path):
+    """
+    Returns the path of the Parquet copy kept next to a csv dataset.
+    """
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def parquet_enabled():
+    return pq is not None and bool(get_config_value("PARQUET_OUTPUT"))
+
+
+def write_dataset(df, csv_path):
+    """
+    Saves a dataset in csv and, when pyarrow is installed and PARQUET_OUTPUT
+    is set, in a Parquet file next to it.
+
+    The Parquet file is written in row groups of PARQUET_ROW_GROUP_SIZE rows,
+    so the Arrow copy of the data never holds more than one group, and is
+    renamed into place once complete. Data Arrow cannot convert, like columns
+    mixing types, only gets the csv.
+
+    Parameters
+    ----------
+    df: pandas.core.frame.DataFrame
+        The data to be saved.
+    csv_path: str
+        Path of the csv file.
+
+    Raises
+    ------
+    No Raises.
+
+    Returns
+    -------
+    No Returns.
+    """
+
+    df.to_csv(csv_path, index=False)
+
+    path = parquet_path(csv_path)
+    if not parquet_enabled():
+        # A Parquet file left by a previous run would no longer match the csv
+        if os.path.exists(path):
+            os.remove(path)
+        return
+
+    row_group_size = max(1, int(get_config_value("PARQUET_ROW_GROUP_SIZE")))
+    tmp_path = path + ".tmp"
+    try:
+        schema = pa.Schema.from_pandas(df, preserve_index=False)
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for start in range(0, len(df), row_group_size):
+                batch = df.iloc[start:start + row_group_size]
+                writer.write_table(pa.Table.from_pandas(batch, schema=schema, preserve_index=False))
+    except pa.ArrowException as e:
+        # Columns mixing types have no Arrow schema, the csv alone is kept
+        print(f"Parquet copy of {csv_path} not written: {e}")
+        for stale_path in (tmp_path, path):
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+        return
+    os.replace(tmp_path, path)
+
+
+def read_dataset(csv_path, **kwargs):
+    """
+    Reads a dataset, from its Parquet copy when there is an up to date one.
+
+    Parameters
+    ----------
+    csv_path: str
+        Path of the csv file.
+    kwargs:
+        Options passed to pandas.read_csv when the csv file is read.
+
+    Raises
+    ------
+    FileNotFoundError
+        If neither the csv nor the Parquet file exist.
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame
+        The data read.
+    """
+
+    path = parquet_path(csv_path)
+    if pq is not None and os.path.exists(path):
+        # A csv uploaded or edited after the Parquet file was written wins
+        if not os.path.exists(csv_path) or os.path.getmtime(path) >= os.path.getmtime(csv_path):
+            return pd.read_parquet(path)
+    return pd.read_csv(csv_path, **kwargs)
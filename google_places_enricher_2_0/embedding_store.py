@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from google_places_enricher_2_0.config import get_config_value
+from google_places_enricher_2_0.models import get_sentence_model, is_model_loaded, model_key
+
+EMBEDDING_STORE_PATH = "./static/data/cache/embeddings"
+
+
+def phrase_key(phrase):
+    """
+    Builds the key of a phrase in the embedding store.
+    """
+    return hashlib.sha256(str(phrase).encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    On-disk store of the embeddings of the phrases encoded by a model.
+
+    The vectors are kept in a NumPy array file opened as a memory map, and a
+    JSON index maps the hash of each phrase to its row. Phrases missing from
+    the store are encoded once and appended to it.
+
+    Parameters
+    ----------
+    model_name: str
+        Key of the model generating the embeddings (see models.model_key), each
+        model has its own store.
+    path: str
+        Directory holding the stores of all the models.
+    """
+
+    def __init__(self, model_name, path=EMBEDDING_STORE_PATH):
+        self.model_name = model_name
+        self.directory = os.path.join(path, re.sub(r"[^\w.-]", "_", model_name))
+        self.vectors_path = os.path.join(self.directory, "vectors.npy")
+        self.index_path = os.path.join(self.directory, "index.json")
+        self._lock = threading.Lock()
+        self._vectors = None
+        self.index = {}
+        if os.path.exists(self.index_path) and os.path.exists(self.vectors_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                self.index = json.load(f)
+            self._vectors = np.load(self.vectors_path, mmap_mode="r")
+            # Rows appended to the vectors by a run that crashed before the index
+            self.index = {key: row for key, row in self.index.items() if row < len(self._vectors)}
+
+    def __len__(self):
+        return len(self.index)
+
+    def missing(self, phrases):
+        """
+        Returns the unique phrases that are not in the store yet.
+        """
+        return list({phrase_key(p): p for p in phrases if phrase_key(p) not in self.index}.values())
+
+    def encode(self, phrases, model=None):
+        """
+        Returns the embeddings of the phrases, encoding only the ones not stored yet.
+
+        Parameters
+        ----------
+        phrases: list
+            The phrases to be encoded.
+        model: sentence_transformers.SentenceTransformer
+            Model used for the missing phrases, defaults to the shared model.
+
+        Raises
+        ------
+        No Raises.
+
+        Returns
+        -------
+        numpy.ndarray
+            One float32 row per phrase.
+        """
+
+        phrases = [str(p) for p in phrases]
+        with self._lock:
+            if not phrases:
+                dimension = 0 if self._vectors is None else self._vectors.shape[1]
+                return np.empty((0, dimension), dtype=np.float32)
+            missing = self.missing(phrases)
+            if missing:
+                model = model or get_sentence_model()
+                self._append(missing, model.encode(missing, convert_to_numpy=True))
+            rows = [self.index[phrase_key(p)] for p in phrases]
+            return np.asarray(self._vectors[rows], dtype=np.float32)
+
+    def _append(self, phrases, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self._vectors is not None:
+            # The memory map is released before the file is replaced
+            vectors = np.concatenate([np.asarray(self._vectors), vectors])
+            start = len(self._vectors)
+            self._vectors = None
+        else:
+            start = 0
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.vectors_path + ".tmp", "wb") as f:
+            np.save(f, vectors)
+        os.replace(self.vectors_path + ".tmp", self.vectors_path)
+
+        self.index.update({phrase_key(p): start + row for row, p in enumerate(phrases)})
+        with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(self.index_path + ".tmp", self.index_path)
+        self._vectors = np.load(self.vectors_path, mmap_mode="r")
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_embedding_store(model_name=None):
+    """
+    Returns the process-wide EmbeddingStore of a model, defaults to the
+    configured MODEL_NAME and MODEL_BACKEND.
+    """
+    model_name = model_name or model_key()
+    with _stores_lock:
+        if model_name not in _stores:
+            _stores[model_name] = EmbeddingStore(model_name)
+        return _stores[model_name]
+
+
+def extend_embeddings(phrases):
+    """
+    Encodes the phrases missing from the store in a background thread.
+
+    Nothing is done when the model is not loaded yet, so saving the
+    enrichment categories never waits for, nor triggers, the model loading;
+    the phrases are then encoded by the next matching request.
+
+    Returns
+    -------
+    threading.Thread
+        The thread encoding the phrases, or None.
+    """
+
+    if not get_config_value("EMBEDDING_CACHE_ENABLED") or not is_model_loaded():
+        return None
+
+    def encode():
+        try:
+            get_embedding_store().encode(phrases)
+        except Exception as e:
+            print(f"Error updating the embedding store: {e}")
+
+    thread = threading.Thread(target=encode, name="embedding-store", daemon=True)
+    thread.start()
+    return thread
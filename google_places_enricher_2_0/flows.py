@@ -1,66 +1,120 @@
-import shapely.geometry
-import pyproj
-import requests
-from google_places_enricher_2_0.config import set_config_value
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from google_places_enricher_2_0.checkpoint import RunCheckpoint
+from google_places_enricher_2_0.collector import PlaceCollector
+from google_places_enricher_2_0.config import get_config_value, set_config_values
+from google_places_enricher_2_0.grid import (
+    area_bounds,
+    build_grid,
+    compare_tilings,
+    parse_area,
+    project_area,
+    project_box,
+    subdivide_circles,
+    unproject_points,
+    write_coordinates
+)
+from google_places_enricher_2_0.places_client import get_places_client
+from google_places_enricher_2_0.rate_limiter import RateLimiter
+from google_places_enricher_2_0.response_cache import ResponseCache, cache_key
 from google_places_enricher_2_0.utils import (
     read_file,
-    initialize_variables_request,
+    extract_establishment_rows,
     create_places_post_request,
     export_data_request, 
     create_message_request
 )
 
+# places:searchText returns at most API_MAX_PAGES pages of API_PAGE_SIZE results
+API_PAGE_SIZE = 20
+API_MAX_PAGES = 3
+
 
-def calculate_coordinates(radius, southwest_lat, southwest_lon, northeast_lat, northeast_lon):
+def calculate_coordinates(radius, southwest_lat, southwest_lon, northeast_lat, northeast_lon,
+                          tiling="square", area=None):
     """
     Generates a CSV file with geographic coordinates of a rectangular area
     according to a predefined step in meters, and updates the config values in config.json.
-    """
 
-    set_config_value("RADIUS", radius)
-    set_config_value("SOUTHWEST_LAT", southwest_lat)
-    set_config_value("SOUTHWEST_LON", southwest_lon)
-    set_config_value("NORTHEAST_LAT", northeast_lat)
-    set_config_value("NORTHEAST_LON", northeast_lon)
+    The circles are laid out with the requested tiling, and the point count,
+    coverage and overlap ratio of every tiling are reported so they can be
+    compared. When an `area` polygon (GeoJSON) is given, the rectangle is its
+    bounding box and only the circles reaching the polygon are kept.
 
-    RADIUS = radius
-    SOUTHWEST_LAT = southwest_lat
-    NORTHEAST_LAT = northeast_lat
-    NORTHEAST_LON = northeast_lon
-    SOUTHWEST_LON = southwest_lon
+    Raises
+    ------
+    ValueError
+        If the area is not a valid GeoJSON polygon or multipolygon.
 
-    to_proxy_transformer = pyproj.Transformer.from_crs("epsg:4326", "epsg:3857")
-    to_original_transformer = pyproj.Transformer.from_crs("epsg:3857", "epsg:4326")
+    Returns
+    -------
+    dict
+        The outcome message, the tiling used, its number of points and the
+        report of all the tilings.
+    """
 
-    sw = shapely.geometry.Point(SOUTHWEST_LAT, SOUTHWEST_LON)
-    ne = shapely.geometry.Point(NORTHEAST_LAT, NORTHEAST_LON)
+    if area is not None:
+        area = parse_area(area)
+        southwest_lat, southwest_lon, northeast_lat, northeast_lon = area_bounds(area)
 
-    stepsize = RADIUS + (RADIUS / 2)
+    set_config_values({
+        "RADIUS": radius,
+        "SOUTHWEST_LAT": southwest_lat,
+        "SOUTHWEST_LON": southwest_lon,
+        "NORTHEAST_LAT": northeast_lat,
+        "NORTHEAST_LON": northeast_lon,
+        "TILING": tiling,
+    })
 
-    transformed_sw = to_proxy_transformer.transform(sw.x, sw.y)
-    transformed_ne = to_proxy_transformer.transform(ne.x, ne.y)
+    # The area is projected once, and the requested grid is reused by the report
+    box = project_box(southwest_lat, southwest_lon, northeast_lat, northeast_lon)
+    projected_area = project_area(area) if area is not None else None
+    grid = build_grid(radius, box, tiling, projected_area)
+    lats, lons = unproject_points(grid[0], grid[1])
+    write_coordinates("./static/data/output/lat_lon_calculated.csv", lats, lons)
 
-    gridpoints = []
-    x = transformed_sw[0] + (3 / 4 * RADIUS)
-    while x < transformed_ne[0]:
-        y = transformed_sw[1] + (3 / 4 * RADIUS)
-        while y < transformed_ne[1]:
-            p = shapely.geometry.Point(to_original_transformer.transform(x, y))
-            gridpoints.append(p)
-            y += stepsize
-        x += stepsize
+    report = compare_tilings(radius, box, projected_area, grids={tiling: grid})
+    result = {
+        "message": "Execution went successfully.",
+        "tiling": tiling,
+        "points": int(len(lats)),
+        "tilings": report,
+    }
+    if area is not None:
+        result["bounding_box_points"] = report[tiling]["bounding_box_points"]
+        result["points_saved"] = report[tiling]["points_saved"]
+    return result
 
-    with open("./static/data/output/lat_lon_calculated.csv", "w") as of:
-        of.write("lat;lon\n")
-        for p in gridpoints:
-            of.write("{:f};{:f}\n".format(p.x, p.y))
+def is_quota_error(status_code, response_data):
+    """
+    Checks if a Google Places response was rejected for exceeding the quota.
+    """
+    if status_code == 429:
+        return True
+    error = response_data.get("error") if isinstance(response_data, dict) else None
+    return isinstance(error, dict) and error.get("status") == "RESOURCE_EXHAUSTED"
 
-    return "Execution went successfully."
+def is_invalid_argument(response_data):
+    """
+    Checks if a Google Places response rejected the request as invalid, as
+    happens with an expired page token.
+    """
+    error = response_data.get("error") if isinstance(response_data, dict) else None
+    return isinstance(error, dict) and error.get("status") == "INVALID_ARGUMENT"
 
-def make_request(url, params=None, method="GET", headers=None):
+def make_request(url, params=None, method="GET", headers=None, limiter=None, cache=None,
+                 cache_params=None, cache_lookup=True):
     """
     Makes an HTTP request according to the specified method and returns the JSON response.
 
+    The response cache is consulted before going to the network, and
+    successful responses are stored in it. Requests go through the shared
+    PlacesClient connection pool. Quota errors (HTTP 429 / RESOURCE_EXHAUSTED)
+    are retried up to MAX_RETRIES times with an exponential back-off, which
+    also slows the limiter down.
+
     Parameters
     ----------
     url : str
@@ -69,30 +123,236 @@ def make_request(url, params=None, method="GET", headers=None):
         Optional parameters to include in the request.
     method : str
         The HTTP method to use (GET or POST).
+    limiter : RateLimiter
+        Optional limiter a token is taken from before each attempt.
+    cache : ResponseCache
+        Optional cache of previous responses.
+    cache_params : dict
+        Parameters identifying the request in the cache, when they differ from `params`.
+    cache_lookup : bool
+        Consults the cache before the request, False to only store the response in it.
 
     Returns
     -------
     dict
         The JSON response.
     """
-    try:
-        if method.upper() == "POST":
-            response = requests.post(url, json=params, headers=headers)
-        else:
-            response = requests.get(url, params=params, headers=headers)
-        print("Request URL:", response.url)
-        response_data = response.json()
-        print("Response:", response_data)
-        return response_data
-    except Exception as e:
-        print("Error during request:", str(e))
-        return {"status": "ERROR", "error_message": str(e)}
-
-def request_google_places():
+    if cache is not None:
+        key = cache_key(url, headers, params if cache_params is None else cache_params)
+        cached = cache.get(key) if cache_lookup else None
+        if cached is not None:
+            return cached
+
+    max_retries = int(get_config_value("MAX_RETRIES"))
+    backoff = float(get_config_value("RETRY_BACKOFF_SECONDS"))
+
+    for attempt in range(max_retries + 1):
+        if limiter is not None and not limiter.acquire():
+            return {"status": "ERROR", "error_message": "Request budget exhausted"}
+        try:
+            response = get_places_client().request(url, params=params, method=method, headers=headers)
+            print("Request URL:", response.url)
+            response_data = response.json()
+            print("Response:", response_data)
+        except Exception as e:
+            print("Error during request:", str(e))
+            return {"status": "ERROR", "error_message": str(e)}
+
+        if not is_quota_error(response.status_code, response_data):
+            if limiter is not None:
+                limiter.recover()
+            if cache is not None and response.status_code == 200 and "error" not in response_data:
+                cache.set(key, response_data)
+            return response_data
+
+        if limiter is not None:
+            limiter.backoff()
+        if attempt < max_retries:
+            delay = backoff * (2 ** attempt)
+            print(f"Quota exceeded, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    return response_data
+
+def log_run_stats(limiter, cache):
+    """
+    Prints the rate limiter and response cache statistics of a run.
+    """
+    print("Rate limiter:", limiter.stats())
+    if cache is not None:
+        print("Response cache:", cache.stats())
+
+def is_error_response(response):
+    """
+    Checks if a Google Places response reports an error instead of results.
+    """
+    return response.get("status") == "ERROR" or "error" in response
+
+def request_places_pages(lat, lon, cat, radius=None, limiter=None, cache=None, max_pages=1,
+                         refresh=False):
+    """
+    Requests the result pages of a search, following nextPageToken until
+    there are no more pages or `max_pages` were fetched. A None `radius`
+    searches with the configured RADIUS.
+
+    Pages after the first one are cached by page number, since their page
+    tokens change on every search. When the first page came from the cache
+    and its page token expired, the search is made again with `refresh`,
+    which skips the cache lookups but still stores the fresh pages.
+
+    A search is saturated when it reached the result cap: it still had a
+    nextPageToken after `max_pages` pages, or its last page was full and
+    was the last one the API hands out.
+
+    Returns
+    -------
+    dict
+        The places of all the pages, with the nextPageToken left after the last
+        page and the saturated flag, or the error response that interrupted the search.
+    """
+    places = []
+    page_token = None
+    page_size = 0
+    first_page_cached = False
+    for page in range(max_pages):
+        url, headers, payload = create_places_post_request(
+            lat, lon, cat, page_token=page_token, radius=radius
+        )
+        cache_params = None
+        if page_token:
+            cache_params = dict(payload, pageToken=page)
+        response = None
+        if page == 0 and cache is not None and not refresh:
+            # Looked up here to know if the page tokens may have expired
+            response = cache.get(cache_key(url, headers, payload))
+            first_page_cached = response is not None
+        if response is None:
+            response = make_request(
+                url, params=payload, method="POST", headers=headers,
+                limiter=limiter, cache=cache, cache_params=cache_params,
+                cache_lookup=page > 0 and not refresh
+            )
+        if is_error_response(response):
+            if page > 0 and first_page_cached and is_invalid_argument(response):
+                # The cached first page handed out a page token that already expired
+                return request_places_pages(
+                    lat, lon, cat, radius=radius, limiter=limiter, cache=cache,
+                    max_pages=max_pages, refresh=True
+                )
+            return response
+        # An empty result comes back as an empty object
+        page_size = len(response.get("places", []))
+        places.extend(response.get("places", []))
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            break
+    saturated = bool(page_token) or (page + 1 >= API_MAX_PAGES and page_size >= API_PAGE_SIZE)
+    return {"places": places, "nextPageToken": page_token, "saturated": saturated}
+
+def request_places_unit(unit, limiter=None, checkpoint=None, cache=None, max_pages=1):
+    """
+    Makes the Google Places requests of a single search unit.
+
+    Units already stored in the checkpoint are answered from it, and newly
+    completed ones are recorded in it as soon as they finish.
+
+    Parameters
+    ----------
+    unit : tuple
+        The (lat, lon, category, radius) to search for.
+    limiter : RateLimiter
+        Optional limiter shared by the whole run.
+    checkpoint : RunCheckpoint
+        Optional checkpoint of the run.
+    cache : ResponseCache
+        Optional cache of previous responses.
+    max_pages : int
+        Maximum number of result pages requested.
+
+    Returns
+    -------
+    dict
+        The places found, or the error response.
+    """
+    lat, lon, cat, radius = unit
+    if checkpoint is not None:
+        response = checkpoint.get(lat, lon, cat)
+        if response is not None:
+            return response
+
+    response = request_places_pages(
+        lat, lon, cat, radius=radius, limiter=limiter, cache=cache, max_pages=max_pages
+    )
+
+    if checkpoint is not None and not is_error_response(response):
+        checkpoint.record(lat, lon, cat, response)
+    return response
+
+def subdivide_units(units):
+    """
+    Splits saturated search units into the four units of their quadrants.
+
+    Parameters
+    ----------
+    units : list
+        The (lat, lon, category, radius) units to split.
+
+    Returns
+    -------
+    list
+        The child units, four per parent and in the parents' order.
+    """
+    lats, lons, radii = subdivide_circles(
+        [unit[0] for unit in units],
+        [unit[1] for unit in units],
+        [unit[3] for unit in units]
+    )
+    categories = [unit[2] for unit in units for _ in range(4)]
+    return list(zip(lats.tolist(), lons.tolist(), categories, radii.tolist()))
+
+def request_google_places(resume=False, max_pages=None, adaptive=False, job=None):
     """
     Makes requests to the new Google Places Nearby Search API (POST),
     enriching data based on provided coordinates and categories.
 
+    The (coordinate x category) requests are spread over a pool of
+    REQUEST_WORKERS threads, while the results are consumed in the same
+    order as a serial run so the exported data stays deterministic. All the
+    workers share a RateLimiter enforcing REQUESTS_PER_SECOND and the
+    REQUEST_BUDGET of the run.
+
+    Every completed unit is journaled in a RunCheckpoint, so after a crash or
+    an API error the run can be started again with `resume` and only the
+    missing units are requested. Searches repeated across runs are answered
+    from the on-disk ResponseCache when CACHE_ENABLED is set. Each search
+    follows up to MAX_PAGES result pages, fetched by the same worker while the
+    other workers keep searching the other units.
+
+    In `adaptive` mode the grid is only a coarse first level: every search that
+    reached the result cap (see request_places_pages) is saturated, so it is
+    repeated on the four quadrants of its circle, recursively up to
+    ADAPTIVE_MAX_DEPTH levels. The number of calls then follows the density
+    of establishments instead of the size of the area. Levels are requested
+    one after the other, which keeps the output order deterministic.
+
+    Establishments are deduplicated by place_id as soon as they arrive, and the
+    duplicate ratio of every grid cell is saved in utils.CELL_REPORT_PATH.
+
+    When run as a background `job`, every consumed search is reported as
+    progress, and a cancellation stops the run like an API error does, so it
+    can be resumed later.
+
+    Parameters
+    ----------
+    resume : bool
+        Reuses the units completed by the previous run instead of starting over.
+    max_pages : int
+        Maximum number of result pages per search, defaults to MAX_PAGES.
+    adaptive : bool
+        Subdivides the saturated searches instead of keeping only their first pages.
+    job : jobs.Job
+        Optional background job running the flow.
+
     Returns
     -------
     str
@@ -110,62 +370,77 @@ def request_google_places():
     if len(df_categories) == 0:
         df_categories.loc[0] = [""]
 
-    establishments_features_data, establishments_features_labels = (
-        initialize_variables_request()
+    collector = PlaceCollector()
+
+    radius = float(get_config_value("RADIUS"))
+    units = [
+        (lat, lon, cat, radius)
+        for lat, lon in zip(df_latlon["lat"], df_latlon["lon"])
+        for cat in df_categories["category"]
+    ]
+    workers = max(1, int(get_config_value("REQUEST_WORKERS")))
+    if max_pages is None:
+        max_pages = get_config_value("MAX_PAGES")
+    max_pages = max(1, int(max_pages))
+    max_depth = int(get_config_value("ADAPTIVE_MAX_DEPTH")) if adaptive else 0
+    limiter = RateLimiter(
+        get_config_value("REQUESTS_PER_SECOND"),
+        budget=get_config_value("REQUEST_BUDGET")
+    )
+
+    checkpoint = RunCheckpoint(resume=resume)
+    if checkpoint.completed:
+        print(f"Resuming run, {len(checkpoint.completed)} searches already completed.")
+    cache = None
+    if get_config_value("CACHE_ENABLED"):
+        cache = ResponseCache(
+            ttl=float(get_config_value("CACHE_TTL_SECONDS")),
+            max_bytes=int(get_config_value("CACHE_MAX_MB")) * 1024 * 1024
+        )
+    request_unit = partial(
+        request_places_unit,
+        limiter=limiter, checkpoint=checkpoint, cache=cache, max_pages=max_pages
     )
 
-    for lat_lon in df_latlon.iterrows():
-        lat = lat_lon[1]["lat"]
-        lon = lat_lon[1]["lon"]
-
-        for cat in df_categories["category"]:
-            establishments = []
-
-            url, headers, payload = create_places_post_request(lat, lon, cat)
-
-            # Use POST method for the request
-            response = make_request(url, params=payload, method="POST", headers=headers)
-
-            if response.get("status") == "ERROR":
-                return f"Error: {response.get('error_message')}"
-
-            if "places" not in response:
-                return f"Error: {response}"
-
-            establishments.extend(response["places"])
-
-            # TODO: Handle pagination if required by the API
-            for establishment in establishments:
-                for feature_index, label in enumerate(establishments_features_labels):
-                    try:
-                        if label == "business_status":
-                            value = establishment.get("businessStatus")
-                        elif label == "geometry":
-                            location = establishment.get("location", {})
-                            value = f"{location.get('latitude')}, {location.get('longitude')}"
-                        elif label == "name":
-                            value = establishment.get("displayName", {}).get("text")
-                        elif label == "place_id":
-                            value = establishment.get("id")
-                        elif label == "price_level":
-                            value = establishment.get("priceLevel")
-                        elif label == "rating":
-                            value = establishment.get("rating")
-                        elif label == "types":
-                            value = ", ".join(establishment.get("types", []))
-                        elif label == "user_ratings_total":
-                            value = establishment.get("userRatingCount")
-                        elif label == "vicinity":
-                            value = establishment.get("formattedAddress")
-                        elif label == "category":
-                            value = cat  # Custom category
-                        else:
-                            value = None
-                        establishments_features_data[feature_index].append(value)
-                    except Exception as e:
-                        establishments_features_data[feature_index].append(None)
-
-    print(establishments_features_data)
-    print(establishments_features_labels)
-    export_data_request(establishments_features_labels, establishments_features_data)
+    with checkpoint, cache or nullcontext(), ThreadPoolExecutor(max_workers=workers) as executor:
+        level = units
+        for depth in range(max_depth + 1):
+            saturated = []
+            if job is not None:
+                job.add_total(len(level))
+            # map() yields the responses in submission order, whatever order
+            # the workers finish them in.
+            responses = executor.map(request_unit, level)
+
+            for unit, response in zip(level, responses):
+                if is_error_response(response):
+                    executor.shutdown(cancel_futures=True)
+                    log_run_stats(limiter, cache)
+                    print(f"{len(checkpoint.checkpointed)} searches are checkpointed, resume the run to continue.")
+                    if response.get("status") == "ERROR":
+                        return f"Error: {response.get('error_message')}"
+                    return f"Error: {response}"
+
+                if response.get("saturated"):
+                    saturated.append(unit)
+
+                collector.add(extract_establishment_rows(response["places"], unit[2]), unit[:2])
+
+                if job is not None:
+                    job.advance()
+                    if job.cancelled:
+                        executor.shutdown(cancel_futures=True)
+                        log_run_stats(limiter, cache)
+                        print(f"{len(checkpoint.checkpointed)} searches are checkpointed, resume the run to continue.")
+                        return "Cancelled: the run was stopped before it finished."
+
+            if adaptive:
+                print(f"Level {depth}: {len(saturated)} of {len(level)} searches saturated.")
+            if not saturated or depth == max_depth:
+                break
+            level = subdivide_units(saturated)
+
+    print("Establishments:", collector.stats())
+    log_run_stats(limiter, cache)
+    export_data_request(collector)
     return "Execution went successfully."
@@ -0,0 +1,395 @@
+import math
+import numpy as np
+import pyproj
+import shapely
+import shapely.geometry
+
+TILINGS = ("square", "hexagonal")
+
+
+def lattice_axis(start, stop, step):
+    """
+    Generates the values start, start + step, ... lower than stop.
+
+    The values are accumulated one addition at a time, exactly like a
+    `while value < stop: value += step` loop, so both give the same floats.
+
+    Parameters
+    ----------
+    start: float
+        First value of the axis.
+    stop: float
+        Exclusive upper bound of the axis.
+    step: float
+        Distance between consecutive values.
+
+    Returns
+    -------
+    numpy.ndarray
+        The values of the axis.
+    """
+    if not start < stop:
+        return np.empty(0)
+    count = int(np.ceil((stop - start) / step)) + 1
+    values = np.cumsum(np.concatenate(([start], np.full(count, step))))
+    return values[values < stop]
+
+def transform_points(transformer, xs, ys):
+    """
+    Transforms arrays of coordinates with a single batched call.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        The transformed coordinates.
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    if xs.size == 1:
+        # pyproj sends one-element arrays down its scalar code path
+        xs, ys = xs.tolist(), ys.tolist()
+    out_xs, out_ys = transformer.transform(xs, ys)
+    return np.asarray(out_xs, dtype=float), np.asarray(out_ys, dtype=float)
+
+def project_box(southwest_lat, southwest_lon, northeast_lat, northeast_lon):
+    """
+    Converts the corners of a rectangular area to EPSG:3857 (meters).
+
+    Returns
+    -------
+    tuple
+        The (sw_x, sw_y, ne_x, ne_y) corners of the projected area.
+    """
+    to_proxy_transformer = pyproj.Transformer.from_crs("epsg:4326", "epsg:3857")
+    sw_x, sw_y = to_proxy_transformer.transform(southwest_lat, southwest_lon)
+    ne_x, ne_y = to_proxy_transformer.transform(northeast_lat, northeast_lon)
+    return sw_x, sw_y, ne_x, ne_y
+
+def unproject_points(xs, ys):
+    """
+    Converts EPSG:3857 points back to latitudes and longitudes with a single
+    batched transformation.
+    """
+    to_original_transformer = pyproj.Transformer.from_crs("epsg:3857", "epsg:4326")
+    return transform_points(to_original_transformer, xs, ys)
+
+def parse_area(geojson):
+    """
+    Reads the area of interest from a GeoJSON Polygon or MultiPolygon.
+
+    Parameters
+    ----------
+    geojson: dict
+        A GeoJSON geometry, or a Feature holding one, in [lon, lat] order.
+
+    Raises
+    ------
+    ValueError
+        If the GeoJSON is not a valid polygon or multipolygon.
+
+    Returns
+    -------
+    shapely.Geometry
+        The area, in longitude/latitude.
+    """
+    if isinstance(geojson, dict) and geojson.get("type") == "Feature":
+        geojson = geojson.get("geometry")
+    if not isinstance(geojson, dict) or geojson.get("type") not in ("Polygon", "MultiPolygon"):
+        raise ValueError("The area must be a GeoJSON Polygon or MultiPolygon")
+    try:
+        area = shapely.geometry.shape(geojson)
+    except Exception as e:
+        raise ValueError(f"Invalid GeoJSON geometry: {str(e)}")
+    if area.is_empty or not area.is_valid:
+        raise ValueError("The area polygon is empty or invalid")
+    return area
+
+def area_bounds(area):
+    """
+    Returns the (southwest_lat, southwest_lon, northeast_lat, northeast_lon)
+    bounding rectangle of an area.
+    """
+    min_lon, min_lat, max_lon, max_lat = area.bounds
+    return min_lat, min_lon, max_lat, max_lon
+
+def project_area(area):
+    """
+    Converts a longitude/latitude area to EPSG:3857 and prepares it for
+    repeated containment tests.
+    """
+    to_proxy_transformer = pyproj.Transformer.from_crs("epsg:4326", "epsg:3857", always_xy=True)
+    projected = shapely.transform(
+        area, lambda coords: np.column_stack(transform_points(to_proxy_transformer, coords[:, 0], coords[:, 1]))
+    )
+    shapely.prepare(projected)
+    return projected
+
+def clip_to_area(radius, xs, ys, projected_area):
+    """
+    Keeps the circle centers lying less than one radius away from the area,
+    which are the circles that reach it.
+
+    Parameters
+    ----------
+    radius: float
+        Radius of the circles, in meters.
+    xs, ys: numpy.ndarray
+        Projected circle centers.
+    projected_area: shapely.Geometry
+        The area, in EPSG:3857.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        The centers of the circles reaching the area.
+    """
+    reach = projected_area.buffer(radius)
+    shapely.prepare(reach)
+    inside = shapely.contains_xy(reach, xs, ys)
+    return xs[inside], ys[inside]
+
+def square_lattice(radius, sw_x, sw_y, ne_x, ne_y):
+    """
+    Centers of a square lattice of circles with a step of 1.5 times the radius.
+
+    This is the historical tiling: circles of neighbouring rows and columns
+    overlap, but the middle of each lattice cell is left uncovered.
+    """
+    stepsize = radius + (radius / 2)
+    xs = lattice_axis(sw_x + (3 / 4 * radius), ne_x, stepsize)
+    ys = lattice_axis(sw_y + (3 / 4 * radius), ne_y, stepsize)
+
+    # "ij" indexing keeps the x-major order of the points
+    grid_x, grid_y = np.meshgrid(xs, ys, indexing="ij")
+    return grid_x.ravel(), grid_y.ravel()
+
+def hexagonal_lattice(radius, sw_x, sw_y, ne_x, ne_y):
+    """
+    Centers of a hexagonal packing of circles that fully covers the area.
+
+    Rows are 1.5 radius apart, circles sqrt(3) radius apart within a row, and
+    every other row is shifted by half a column. Each circle then contains
+    its hexagonal Voronoi cell, so keeping every center whose cell reaches
+    the area is enough to cover it with no gaps.
+    """
+    column_step = math.sqrt(3) * radius
+    ys = lattice_axis(sw_y + radius / 2, ne_y + radius, 1.5 * radius)
+    even_xs = lattice_axis(sw_x + column_step / 2, ne_x + column_step / 2, column_step)
+    odd_xs = lattice_axis(sw_x, ne_x + column_step / 2, column_step)
+
+    rows_x = [odd_xs if row % 2 else even_xs for row in range(len(ys))]
+    grid_x = np.concatenate(rows_x) if rows_x else np.empty(0)
+    grid_y = np.repeat(ys, [len(row_x) for row_x in rows_x])
+    return grid_x, grid_y
+
+LATTICES = {
+    "square": square_lattice,
+    "hexagonal": hexagonal_lattice,
+}
+
+def build_grid(radius, box, tiling, projected_area=None):
+    """
+    Builds the projected circle centers of a tiling.
+
+    Parameters
+    ----------
+    radius: float
+        Radius of the search circles, in meters.
+    box: tuple
+        The projected (sw_x, sw_y, ne_x, ne_y) area.
+    tiling: str
+        One of TILINGS.
+    projected_area: shapely.Geometry
+        Optional polygon bounding the grid, in EPSG:3857.
+
+    Raises
+    ------
+    ValueError
+        If the tiling is unknown.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray, int
+        Projected x and y of the circle centers, and the number of circles of
+        the whole rectangle before they were clipped to the area.
+    """
+    if tiling not in LATTICES:
+        raise ValueError(f"Unknown tiling '{tiling}', expected one of {', '.join(TILINGS)}")
+    xs, ys = LATTICES[tiling](radius, *box)
+    box_points = int(len(xs))
+    if projected_area is not None:
+        xs, ys = clip_to_area(radius, xs, ys, projected_area)
+    return xs, ys, box_points
+
+def generate_grid(radius, southwest_lat, southwest_lon, northeast_lat, northeast_lon, tiling="square",
+                  area=None):
+    """
+    Generates the centers of the search circles covering a rectangular area.
+
+    The lattice is built in EPSG:3857 (meters) and converted back to
+    EPSG:4326 with a single batched transformation. When an `area` polygon
+    is given, only the circles reaching it are kept.
+
+    Parameters
+    ----------
+    radius: float
+        Radius of the search circles, in meters.
+    southwest_lat, southwest_lon: float
+        Southwest corner of the area.
+    northeast_lat, northeast_lon: float
+        Northeast corner of the area.
+    tiling: str
+        One of TILINGS.
+    area: shapely.Geometry
+        Optional polygon bounding the grid, in longitude/latitude.
+
+    Raises
+    ------
+    ValueError
+        If the tiling is unknown.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        Latitudes and longitudes of the circle centers.
+    """
+    box = project_box(southwest_lat, southwest_lon, northeast_lat, northeast_lon)
+    projected_area = project_area(area) if area is not None else None
+    xs, ys, _ = build_grid(radius, box, tiling, projected_area)
+    return unproject_points(xs, ys)
+
+def lattice_coverage(radius, xs, ys, box, samples=20000, projected_area=None):
+    """
+    Estimates how well a set of circles covers an area by sampling it.
+
+    Parameters
+    ----------
+    radius: float
+        Radius of the circles, in meters.
+    xs, ys: numpy.ndarray
+        Projected circle centers.
+    box: tuple
+        The projected (sw_x, sw_y, ne_x, ne_y) area.
+    samples: int
+        Number of random points sampled in the rectangle.
+    projected_area: shapely.Geometry
+        Optional polygon the samples are restricted to, in EPSG:3857.
+
+    Returns
+    -------
+    dict
+        The fraction of the area covered by at least one circle, and the
+        overlap ratio: average number of circles over each covered spot
+        (1.0 means the circles do not overlap).
+    """
+    sw_x, sw_y, ne_x, ne_y = box
+    if len(xs) == 0:
+        return {"coverage": 0.0, "overlap_ratio": 0.0}
+    rng = np.random.default_rng(0)
+    sample_xs = rng.uniform(sw_x, ne_x, samples)
+    sample_ys = rng.uniform(sw_y, ne_y, samples)
+    if projected_area is not None:
+        inside = shapely.contains_xy(projected_area, sample_xs, sample_ys)
+        sample_xs, sample_ys = sample_xs[inside], sample_ys[inside]
+        samples = len(sample_xs)
+        if samples == 0:
+            return {"coverage": 0.0, "overlap_ratio": 0.0}
+    sample_points = shapely.points(sample_xs, sample_ys)
+    tree = shapely.STRtree(shapely.points(xs, ys))
+    sample_index, _ = tree.query(sample_points, predicate="dwithin", distance=radius)
+    hits = np.bincount(sample_index, minlength=samples)
+    covered = hits > 0
+    return {
+        "coverage": round(float(covered.mean()), 4),
+        "overlap_ratio": round(float(hits[covered].mean()), 4) if covered.any() else 0.0,
+    }
+
+def compare_tilings(radius, box, projected_area=None, grids=None):
+    """
+    Compares the available tilings of a projected area.
+
+    Parameters
+    ----------
+    radius: float
+        Radius of the search circles, in meters.
+    box: tuple
+        The projected (sw_x, sw_y, ne_x, ne_y) area.
+    projected_area: shapely.Geometry
+        Optional polygon within the rectangle, in EPSG:3857.
+    grids: dict
+        Grids already built by build_grid for this area, by tiling; only the
+        other tilings are built.
+
+    Returns
+    -------
+    dict
+        For each tiling, its number of points (one API call per category each),
+        coverage and overlap ratio. With an area, also the number of points
+        of the whole bounding rectangle and how many of them were saved.
+    """
+    grids = grids or {}
+    report = {}
+    for tiling in LATTICES:
+        xs, ys, box_points = grids.get(tiling) or build_grid(radius, box, tiling, projected_area)
+        report[tiling] = {
+            "points": int(len(xs)),
+            **lattice_coverage(radius, xs, ys, box, projected_area=projected_area)
+        }
+        if projected_area is not None:
+            report[tiling]["bounding_box_points"] = box_points
+            report[tiling]["points_saved"] = box_points - int(len(xs))
+    return report
+
+def tiling_report(radius, southwest_lat, southwest_lon, northeast_lat, northeast_lon, area=None):
+    """
+    Compares the available tilings of a rectangular area, or of an area
+    polygon within that rectangle, see compare_tilings.
+    """
+    box = project_box(southwest_lat, southwest_lon, northeast_lat, northeast_lon)
+    projected_area = project_area(area) if area is not None else None
+    return compare_tilings(radius, box, projected_area)
+
+def subdivide_circles(lats, lons, radii):
+    """
+    Splits search circles into the four circles covering their quadrants.
+
+    The children are centered half a radius away from the parent center on
+    both axes, with a radius of radius / sqrt(2), so together they cover the
+    square circumscribing the parent circle. Offsets are in ground meters,
+    hence scaled by the EPSG:3857 stretching at each latitude.
+
+    Parameters
+    ----------
+    lats, lons: array_like
+        Centers of the parent circles.
+    radii: array_like
+        Radii of the parent circles, in meters.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray, numpy.ndarray
+        Latitudes, longitudes and radii of the children, four per parent in
+        the parents' order.
+    """
+    lats = np.asarray(lats, dtype=float)
+    radii = np.asarray(radii, dtype=float)
+    to_proxy_transformer = pyproj.Transformer.from_crs("epsg:4326", "epsg:3857")
+    xs, ys = transform_points(to_proxy_transformer, lats, lons)
+
+    offsets = radii / 2 / np.cos(np.radians(lats))
+    signs_x = np.array([-1, 1, -1, 1])
+    signs_y = np.array([-1, -1, 1, 1])
+    child_xs = (xs[:, None] + signs_x * offsets[:, None]).ravel()
+    child_ys = (ys[:, None] + signs_y * offsets[:, None]).ravel()
+
+    child_lats, child_lons = unproject_points(child_xs, child_ys)
+    return child_lats, child_lons, np.repeat(radii / math.sqrt(2), 4)
+
+def write_coordinates(path, lats, lons):
+    """
+    Writes the grid points to a semicolon separated CSV with lat and lon columns,
+    in a single write call.
+    """
+    rows = ["{:f};{:f}\n".format(lat, lon) for lat, lon in zip(np.asarray(lats).tolist(), np.asarray(lons).tolist())]
+    with open(path, "w") as of:
+        of.write("lat;lon\n" + "".join(rows))
@@ -0,0 +1,332 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from google_places_enricher_2_0.config import get_config_value
+
+JOBS_DB_PATH = "./static/data/cache/jobs.sqlite3"
+
+# Seconds between two saves of the progress of a running job
+PROGRESS_SAVE_INTERVAL = 1.0
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+)
+"""
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job when its cancellation was requested.
+    """
+
+
+class JobStore:
+    """
+    Persistent table of the background jobs, kept in a SQLite database.
+
+    Only the `retention` most recent finished jobs are kept, with their
+    results, so the table does not grow with every matching request.
+
+    Parameters
+    ----------
+    path: str
+        Path of the database file.
+    retention: int
+        Number of finished jobs kept, defaults to JOB_RETENTION.
+    """
+
+    def __init__(self, path=JOBS_DB_PATH, retention=None):
+        self.path = path
+        self.retention = int(get_config_value("JOB_RETENTION") if retention is None else retention)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute(_SCHEMA)
+            # Jobs of a previous process that stopped before they finished
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrupted by a restart', finished_at = ? "
+                "WHERE status IN ('queued', 'running')",
+                (time.time(),)
+            )
+
+    def insert(self, job_id, kind):
+        finished = ", ".join(f"'{status}'" for status in FINISHED)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, created_at) VALUES (?, ?, 'queued', ?)",
+                (job_id, kind, time.time())
+            )
+            # Queued and running jobs are never dropped
+            self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({finished}) AND id NOT IN ("
+                f"SELECT id FROM jobs WHERE status IN ({finished}) ORDER BY created_at DESC LIMIT ?)",
+                (self.retention,)
+            )
+
+    def update(self, job_id, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        """
+        Returns the row of a job as a dict, or None if it does not exist.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def list(self, limit=50):
+        """
+        Returns the rows of the most recent jobs, without their results.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, status, total, done, error, cancel_requested, created_at, started_at, finished_at "
+                "FROM jobs ORDER BY created_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+class Job:
+    """
+    Handle given to the function of a running job, to report its progress
+    and check if it was cancelled.
+
+    Parameters
+    ----------
+    job_id: str
+        Id of the job.
+    kind: str
+        Kind of work done by the job, e.g. "enrichment".
+    store: JobStore
+        Table where the job is saved.
+    """
+
+    def __init__(self, job_id, kind, store):
+        self.id = job_id
+        self.kind = kind
+        self.store = store
+        self.total = 0
+        self.done = 0
+        self.started_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        """
+        Raises JobCancelled if the cancellation of the job was requested.
+        """
+        if self.cancelled:
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def add_total(self, count):
+        """
+        Adds `count` steps to the work of the job, as more of it is discovered.
+        """
+        with self._lock:
+            self.total += count
+        self._save_progress(force=True)
+
+    def advance(self, count=1):
+        """
+        Marks `count` steps of the job as done.
+        """
+        with self._lock:
+            self.done += count
+        self._save_progress()
+
+    def eta(self):
+        """
+        Returns the estimated seconds left, from the rate of the steps done so far.
+        """
+        if not self.started_at or not self.done or self.total <= self.done:
+            return None
+        elapsed = time.time() - self.started_at
+        return elapsed / self.done * (self.total - self.done)
+
+    def _save_progress(self, force=False):
+        now = time.monotonic()
+        if force or now - self._saved_at >= PROGRESS_SAVE_INTERVAL:
+            self._saved_at = now
+            self.store.update(self.id, total=self.total, done=self.done)
+
+
+class JobManager:
+    """
+    Runs the long tasks of the application in a pool of JOB_WORKERS threads,
+    keeping their status in a JobStore.
+
+    The functions of the jobs receive their Job as first argument, they
+    report their progress with it and stop early when it is cancelled.
+
+    Parameters
+    ----------
+    store: JobStore
+        Table of the jobs.
+    workers: int
+        Number of jobs running at the same time, defaults to JOB_WORKERS.
+    """
+
+    def __init__(self, store=None, workers=None):
+        self.store = store or JobStore()
+        workers = workers or int(get_config_value("JOB_WORKERS"))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job")
+        self._active = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """
+        Queues a job running `fn(job, *args, **kwargs)`.
+
+        Parameters
+        ----------
+        kind: str
+            Kind of work done by the job.
+        fn: callable
+            The task, its return value must be JSON serializable.
+
+        Returns
+        -------
+        Job
+            The queued job.
+        """
+        job = Job(uuid.uuid4().hex, kind, self.store)
+        self.store.insert(job.id, kind)
+        with self._lock:
+            self._active[job.id] = job
+            self._futures[job.id] = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        try:
+            if job.cancelled:
+                self.store.update(job.id, status="cancelled", finished_at=time.time())
+                return
+            job.started_at = time.time()
+            self.store.update(job.id, status="running", started_at=job.started_at)
+            try:
+                result = fn(job, *args, **kwargs)
+            except Exception as e:
+                if job.cancelled:
+                    self.store.update(job.id, status="cancelled", done=job.done, finished_at=time.time())
+                else:
+                    print(f"Job {job.id} ({job.kind}) failed: {e}")
+                    self.store.update(job.id, status="failed", error=str(e), done=job.done, finished_at=time.time())
+                return
+            status = "cancelled" if job.cancelled else "succeeded"
+            self.store.update(job.id, status=status, result=result, total=job.total, done=job.done,
+                              finished_at=time.time())
+        finally:
+            with self._lock:
+                self._active.pop(job.id, None)
+                self._futures.pop(job.id, None)
+
+    def active(self, kind=None):
+        """
+        Returns the queued or running jobs, of one kind if given.
+        """
+        with self._lock:
+            return [job for job in self._active.values() if kind is None or job.kind == kind]
+
+    def status(self, job_id):
+        """
+        Returns the status of a job, or None if it does not exist.
+
+        Returns
+        -------
+        dict
+            The row of the job without its result, plus its live progress
+            and estimated seconds left while it runs.
+        """
+        row = self.store.get(job_id)
+        if row is None:
+            return None
+        row.pop("result")
+        job = self._active.get(job_id)
+        if job is not None:
+            row["total"], row["done"] = job.total, job.done
+        row["progress"] = row["done"] / row["total"] if row["total"] else None
+        row["eta_seconds"] = job.eta() if job is not None else None
+        row["cancel_requested"] = bool(row["cancel_requested"])
+        return row
+
+    def result(self, job_id):
+        """
+        Returns the result of a finished job, or None.
+        """
+        row = self.store.get(job_id)
+        if row is None or row["result"] is None:
+            return None
+        return json.loads(row["result"])
+
+    def cancel(self, job_id):
+        """
+        Requests the cancellation of a queued or running job.
+
+        A queued job never starts, a running one stops at its next check.
+
+        Returns
+        -------
+        bool
+            False if the job is not queued nor running.
+        """
+        with self._lock:
+            job = self._active.get(job_id)
+            if job is None:
+                return False
+            job._cancel.set()
+        self.store.update(job_id, cancel_requested=1)
+        return True
+
+    def wait(self, job_id, timeout=None):
+        """
+        Blocks until a job finishes and returns its status.
+        """
+        future = self._futures.get(job_id)
+        if future is not None:
+            future.exception(timeout=timeout)
+        return self.status(job_id)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager():
+    """
+    Returns the process-wide JobManager, created on first use.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
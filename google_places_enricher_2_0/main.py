@@ -3,6 +3,8 @@ from multiprocessing import freeze_support, Process
 from logging.handlers import RotatingFileHandler
 from threading import Thread
 from google_places_enricher_2_0.app import app
+from google_places_enricher_2_0.config import get_config_value
+from google_places_enricher_2_0.models import warm_up_model
 
 import logging
 import signal
@@ -88,6 +90,10 @@ def flask_app(port=5000):
 def main():
     port = get_open_port()
 
+    # Load the matching model while the window opens
+    if get_config_value("MODEL_WARM_UP"):
+        warm_up_model()
+
     webview_thread = Thread(target=pywebview_thread, args=(port,))
     webview_thread.daemon = True
     webview_thread.start()
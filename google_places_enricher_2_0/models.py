@@ -0,0 +1,118 @@
+import threading
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+from google_places_enricher_2_0.config import get_config_value
+
+# Inference backends of the sentence model:
+#   torch       the PyTorch model, as published
+#   torch-int8  the PyTorch model with its Linear layers dynamically quantized to int8 (CPU only)
+#   onnx        ONNX Runtime, needs the optimum and onnxruntime packages
+BACKENDS = ("torch", "torch-int8", "onnx")
+
+_models = {}
+_lock = threading.Lock()
+
+
+def model_key(name=None, backend=None):
+    """
+    Identifies a model and the backend running it, defaults to MODEL_NAME and
+    MODEL_BACKEND. The onnx backend is also identified by its MODEL_ONNX_FILE.
+
+    Embeddings of the same phrase differ slightly between backends and ONNX
+    exports, so the models and the caches of embeddings are kept by this key.
+    """
+    name = name or get_config_value("MODEL_NAME")
+    backend = backend or get_config_value("MODEL_BACKEND") or "torch"
+    if backend == "torch":
+        return name
+    if backend == "onnx" and get_config_value("MODEL_ONNX_FILE"):
+        return f"{name}@onnx:{get_config_value('MODEL_ONNX_FILE')}"
+    return f"{name}@{backend}"
+
+
+def _load_model(name, backend, onnx_file=""):
+    device = get_config_value("MODEL_DEVICE") or None
+    if backend == "onnx":
+        model_kwargs = {"file_name": onnx_file} if onnx_file else None
+        return SentenceTransformer(name, device=device, backend="onnx", model_kwargs=model_kwargs)
+    model = SentenceTransformer(name, device=device)
+    if backend == "torch-int8":
+        model = torch.ao.quantization.quantize_dynamic(model.to("cpu"), {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def get_sentence_model(name=None, backend=None):
+    """
+    Returns the process-wide SentenceTransformer model, loading it on first use.
+
+    The model runs on MODEL_DEVICE (chosen by sentence-transformers when
+    empty) with the MODEL_BACKEND inference backend, and torch uses
+    MODEL_THREADS threads when it is set.
+
+    Parameters
+    ----------
+    name: str
+        Name of the model, defaults to MODEL_NAME.
+    backend: str
+        One of BACKENDS, defaults to MODEL_BACKEND.
+
+    Raises
+    ------
+    ValueError
+        If the backend is unknown.
+
+    Returns
+    -------
+    sentence_transformers.SentenceTransformer
+        The loaded model.
+    """
+
+    name = name or get_config_value("MODEL_NAME")
+    backend = backend or get_config_value("MODEL_BACKEND") or "torch"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend {backend}, expected one of {', '.join(BACKENDS)}.")
+    key = model_key(name, backend)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _lock:
+        # Loaded by another thread while this one waited for the lock
+        if key not in _models:
+            threads = int(get_config_value("MODEL_THREADS") or 0)
+            if threads > 0:
+                torch.set_num_threads(threads)
+            print(f"Loading sentence model {key}...")
+            onnx_file = key.partition("@onnx:")[2]
+            _models[key] = _load_model(name, backend, onnx_file)
+        return _models[key]
+
+
+def is_model_loaded(name=None, backend=None):
+    """
+    Checks if a model is already loaded, without loading it.
+    """
+    return model_key(name, backend) in _models
+
+
+def warm_up_model(name=None):
+    """
+    Loads the model in a background thread, so the first matching request
+    does not pay the loading time.
+
+    Returns
+    -------
+    threading.Thread
+        The thread loading the model.
+    """
+
+    def load():
+        try:
+            get_sentence_model(name)
+        except Exception as e:
+            print(f"Error warming up the sentence model: {e}")
+
+    thread = threading.Thread(target=load, name="model-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,77 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from google_places_enricher_2_0.config import get_config_value
+
+
+class PlacesClient:
+    """
+    HTTP client for the Google Places API backed by a pooled requests.Session,
+    so consecutive calls reuse kept-alive TCP/TLS connections instead of
+    opening a new one per request.
+
+    Parameters
+    ----------
+    pool_size: int
+        Maximum number of connections kept open per host.
+    timeout: float
+        Connect and read timeout of each request, in seconds.
+    """
+
+    def __init__(self, pool_size=10, timeout=30):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, url, params=None, method="GET", headers=None):
+        """
+        Makes an HTTP request through the pooled session.
+
+        Parameters
+        ----------
+        url: str
+            The URL for the request.
+        params: dict
+            Sent as the JSON body of POST requests and as the query string otherwise.
+        method: str
+            The HTTP method to use (GET or POST).
+        headers: dict
+            Optional request headers.
+
+        Returns
+        -------
+        requests.Response
+            The HTTP response.
+        """
+        if method.upper() == "POST":
+            return self.session.post(url, json=params, headers=headers, timeout=self.timeout)
+        return self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_places_client():
+    """
+    Returns the process-wide PlacesClient, creating it on first use.
+
+    The pool holds HTTP_POOL_SIZE connections, and never fewer than
+    REQUEST_WORKERS so no worker has to wait for a free connection.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            pool_size = max(
+                int(get_config_value("HTTP_POOL_SIZE")),
+                int(get_config_value("REQUEST_WORKERS"))
+            )
+            _client = PlacesClient(
+                pool_size=pool_size,
+                timeout=float(get_config_value("REQUEST_TIMEOUT"))
+            )
+        return _client
@@ -0,0 +1,105 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket that paces the Google Places requests of an enrichment run.
+
+    Tokens are refilled at `requests_per_second` up to `burst` tokens, and at
+    most `budget` tokens are handed out over the lifetime of the limiter
+    (0 means no budget). The rate is halved every time the API answers with a
+    quota error and slowly grows back to the configured rate on successes.
+    A rate of 0 disables the pacing, only the budget is then enforced.
+
+    Parameters
+    ----------
+    requests_per_second: float
+        Maximum sustained request rate, 0 for unlimited.
+    budget: int
+        Maximum number of requests allowed, 0 for unlimited.
+    burst: float
+        Bucket capacity, defaults to one second worth of requests.
+    """
+
+    def __init__(self, requests_per_second, budget=0, burst=None):
+        self.max_rate = max(0.0, float(requests_per_second or 0))
+        self.min_rate = self.max_rate / 32
+        self.rate = self.max_rate
+        self.capacity = float(burst or max(1.0, self.max_rate))
+        self.tokens = self.capacity
+        self.budget = int(budget or 0)
+        self.issued = 0
+        self.throttled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self):
+        """
+        Blocks until a token is available.
+
+        Returns
+        -------
+        bool
+            False if the request budget is exhausted, True otherwise.
+        """
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                if self.budget and self.issued >= self.budget:
+                    return False
+                if self.max_rate == 0:
+                    self.issued += 1
+                    return True
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.issued += 1
+                    waited = time.monotonic() - start
+                    self.wait_total += waited
+                    self.wait_max = max(self.wait_max, waited)
+                    return True
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def backoff(self):
+        """Halves the request rate after a quota error and drains the bucket."""
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.throttled += 1
+
+    def recover(self):
+        """Grows the request rate back towards the configured one after a success."""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill()
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def stats(self):
+        """
+        Summarizes the limiter activity.
+
+        Returns
+        -------
+        dict
+            Number of requests issued and throttled, current rate and the
+            total, average and maximum time callers waited for a token.
+        """
+        with self._lock:
+            return {
+                "requests": self.issued,
+                "throttled": self.throttled,
+                "rate": round(self.rate, 3),
+                "wait_total": round(self.wait_total, 3),
+                "wait_avg": round(self.wait_total / self.issued, 3) if self.issued else 0.0,
+                "wait_max": round(self.wait_max, 3),
+            }
@@ -0,0 +1,58 @@
+import numpy as np
+
+import google_places_enricher_2_0.ann_index as ann_index
+from google_places_enricher_2_0.ann_index import IVFIndex, get_ann_index, normalize
+
+
+def clustered_vectors(n, dim=16, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return centers[rng.integers(0, clusters, n)] + 0.3 * rng.normal(size=(n, dim))
+
+
+def test_ivf_index_search():
+    vectors = clustered_vectors(2000)
+    queries = clustered_vectors(50, seed=1)
+    index = IVFIndex.build(vectors, n_lists=40)
+    assert sorted(index.ids.tolist()) == list(range(2000))
+
+    exact = normalize(queries) @ normalize(vectors).T
+    exact_top = np.argsort(-exact, axis=1)[:, :10]
+
+    # Probing every cluster is an exact search
+    indices, scores = index.search(queries, 10, n_probe=40)
+    assert (indices == exact_top).all()
+    assert np.allclose(scores, np.take_along_axis(exact, exact_top, axis=1), atol=1e-5)
+
+    indices, scores = index.search(queries, 10, n_probe=4)
+    recall = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(indices, exact_top)])
+    assert recall > 0.8
+    assert (np.diff(scores, axis=1) <= 0).all()
+
+
+def test_get_ann_index_rebuilds_on_new_phrases(tmp_path, monkeypatch):
+    monkeypatch.setattr(ann_index, "_index", None)
+    path = str(tmp_path / "categories.ann.npz")
+    vectors = clustered_vectors(300)
+    index = get_ann_index("first", vectors, path=path)
+
+    monkeypatch.setattr(ann_index, "_index", None)
+    reloaded = get_ann_index("first", None, path=path)
+    assert reloaded.fingerprint == "first" and (reloaded.ids == index.ids).all()
+
+    rebuilt = get_ann_index("second", vectors[:100], path=path)
+    assert rebuilt.fingerprint == "second" and len(rebuilt.vectors) == 100
+
+
+def test_get_ann_index_rebuilds_on_new_lists(tmp_path, monkeypatch):
+    monkeypatch.setattr(ann_index, "_index", None)
+    path = str(tmp_path / "categories.ann.npz")
+    vectors = clustered_vectors(300)
+    assert len(get_ann_index("same", vectors, n_lists=4, path=path).centroids) == 4
+
+    # The file on disk is not reused with another ANN_LISTS
+    monkeypatch.setattr(ann_index, "_index", None)
+    assert len(get_ann_index("same", vectors, n_lists=8, path=path).centroids) == 8
+    monkeypatch.setattr(ann_index, "_index", None)
+    reloaded = get_ann_index("same", None, n_lists=8, path=path)
+    assert reloaded.n_lists == 8 and len(reloaded.centroids) == 8
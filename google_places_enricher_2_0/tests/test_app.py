@@ -3,6 +3,7 @@ import io
 import csv
 import shutil
 import tempfile
+import threading
 import pandas as pd
 import numpy as np
 import pytest
@@ -10,6 +11,7 @@ from flask import url_for
 
 from google_places_enricher_2_0.app import app
 import google_places_enricher_2_0.config as app_config
+import google_places_enricher_2_0.jobs as jobs
 import json
 
 @pytest.fixture
@@ -58,7 +60,9 @@ def client(tmp_path, monkeypatch):
             "NORTHEAST_LON": -49.20322728948593,
             "SOUTHWEST_LAT": -25.512242704374355,
             "SOUTHWEST_LON": -49.32304693059921,
-            "API_KEY": "dummy_key"
+            "API_KEY": "dummy_key",
+            # The Parquet copies would be written outside of tmp_path
+            "PARQUET_OUTPUT": False
         }, f)
     # Patch pd.read_csv to support relative paths
     orig_read_csv = pd.read_csv
@@ -84,7 +88,13 @@ def client(tmp_path, monkeypatch):
         return orig_open(path, *args, **kwargs)
     monkeypatch.setattr("builtins.open", open_patch)
     # Patch url_for to not fail outside request context
-    monkeypatch.setattr("google_places_enricher_2_0.app.url_for", lambda endpoint, **values: f"/static/data/output/{values['filename']}")
+    def url_for_patch(endpoint, **values):
+        if endpoint == "static":
+            return f"/static/data/output/{values['filename']}"
+        return f"/{endpoint}/{values['job_id']}"
+    monkeypatch.setattr("google_places_enricher_2_0.app.url_for", url_for_patch)
+    # Jobs are saved in tmp_path, by a manager of their own
+    monkeypatch.setattr(jobs, "_manager", jobs.JobManager(jobs.JobStore(str(tmp_path / "jobs.sqlite3")), workers=1))
     # Provide test client
     with app.test_client() as client:
         yield client
@@ -125,6 +135,10 @@ def test_update_categories_and_process_data_success(client, tmp_path, mocker):
     # Mock request_google_places to return success
     mocker.patch("google_places_enricher_2_0.app.request_google_places", return_value="Execution went successfully.")
     resp = client.post("/update_categories_and_process_data", json={"categories": [["cafe"], ["restaurant"]]})
+    assert resp.status_code == 202
+    job_id = resp.json["job_id"]
+    assert jobs.get_job_manager().wait(job_id, timeout=5)["status"] == "succeeded"
+    resp = client.get(f"/jobs/{job_id}/result")
     assert resp.status_code == 200
     assert resp.json["message"] == "CSV updated successfully"
     # Check file written
@@ -426,9 +440,12 @@ def test_get_categories_to_match_invalid_data(client, monkeypatch):
     import pandas as pd
     monkeypatch.setattr(pd, "read_csv", lambda p, **k: pd.DataFrame({"category": [1]}))
     import app
-    monkeypatch.setattr(app, "create_estab_phrase", lambda df: pd.DataFrame({"phrase_establishment": [123]}))
+    monkeypatch.setattr(app, "intern_estab_phrases", lambda df: (pd.DataFrame({"phrase_establishment": [123]}), None))
     resp = client.get("/get_categories_to_match")
-    assert resp.status_code in (400, 500)
+    assert resp.status_code == 202
+    status = jobs.get_job_manager().wait(resp.json["job_id"], timeout=5)
+    assert status["status"] == "failed"
+    assert client.get(f"/jobs/{status['id']}/result").status_code == 409
 
 def test_export_enriched_dataset_missing_file(client, monkeypatch):
     # Simulate missing establishments file
@@ -446,9 +463,12 @@ def test_export_enriched_dataset_file_error(client, monkeypatch):
 
 def test_update_categories_and_process_data_external_failure(client, mocker):
     # Simulate external dependency failure
-    mocker.patch("app.request_google_places", side_effect=Exception("fail"))
+    mocker.patch("google_places_enricher_2_0.app.request_google_places", side_effect=Exception("fail"))
     resp = client.post("/update_categories_and_process_data", json={"categories": ["cat"]})
-    assert resp.status_code == 500
+    assert resp.status_code == 202
+    status = jobs.get_job_manager().wait(resp.json["job_id"], timeout=5)
+    assert status["status"] == "failed"
+    assert status["error"] == "fail"
 
 def test_update_categories_and_process_data_file_error(client, mocker):
     # Simulate file write error
@@ -488,3 +508,64 @@ def test_upload_dataset_invalid_file_cases(client, mocker, data, patch_file_erro
 def test_upload_csv_no_file(client):
     resp = client.post("/upload_csv", data={}, content_type="multipart/form-data")
     assert resp.status_code == 400
+
+def test_calculate_coordinates_tiling(client, mocker):
+    calculate = mocker.patch(
+        "google_places_enricher_2_0.app.calculate_coordinates",
+        return_value={"message": "Execution went successfully.", "tiling": "hexagonal", "points": 3, "tilings": {}}
+    )
+    body = {"radius": 1000, "southwestLat": -25.5, "southwestLon": -49.3, "northeastLat": -25.4, "northeastLon": -49.2}
+    resp = client.post("/calculate_coordinates", json={**body, "tiling": "hexagonal"})
+    assert resp.status_code == 200
+    assert resp.json["points"] == 3
+    assert calculate.call_args.kwargs["tiling"] == "hexagonal"
+
+    resp = client.post("/calculate_coordinates", json={**body, "tiling": "triangular"})
+    assert resp.status_code == 400
+
+    # Without a tiling, the one stored in the config is used
+    resp = client.post("/calculate_coordinates", json=body)
+    assert calculate.call_args.kwargs["tiling"] == "square"
+    app_config.set_config_value("TILING", "hexagonal")
+    resp = client.post("/calculate_coordinates", json=body)
+    assert resp.status_code == 200
+    assert calculate.call_args.kwargs["tiling"] == "hexagonal"
+
+
+def test_calculate_coordinates_invalid_polygon(client):
+    resp = client.post("/calculate_coordinates", json={
+        "radius": 1000, "polygon": {"type": "Point", "coordinates": [-49.3, -25.5]}
+    })
+    assert resp.status_code == 400
+    assert "Polygon" in resp.json["error"]
+
+def test_job_endpoints(client, mocker):
+    for resp in (client.get("/jobs/unknown"), client.get("/jobs/unknown/result"), client.post("/jobs/unknown/cancel")):
+        assert resp.status_code == 404
+
+    mocker.patch("google_places_enricher_2_0.app.request_google_places", return_value="Execution went successfully.")
+    job_id = client.post("/update_categories_and_process_data", json={"categories": [["cafe"]]}).json["job_id"]
+    jobs.get_job_manager().wait(job_id, timeout=5)
+    resp = client.get(f"/jobs/{job_id}")
+    assert resp.status_code == 200
+    assert resp.json["kind"] == "enrichment"
+    assert resp.json["status"] == "succeeded"
+    assert [job["id"] for job in client.get("/jobs").json["jobs"]] == [job_id]
+    # A finished job can no longer be cancelled
+    assert client.post(f"/jobs/{job_id}/cancel").status_code == 409
+
+def test_update_categories_and_process_data_single_enrichment(client, mocker):
+    release = threading.Event()
+    def run(**kwargs):
+        release.wait(5)
+        return "Execution went successfully."
+    mocker.patch("google_places_enricher_2_0.app.request_google_places", side_effect=run)
+    first = client.post("/update_categories_and_process_data", json={"categories": [["cafe"]]})
+    assert first.status_code == 202
+    try:
+        second = client.post("/update_categories_and_process_data", json={"categories": [["bar"]]})
+        assert second.status_code == 409
+        assert second.json["job_id"] == first.json["job_id"]
+    finally:
+        release.set()
+    assert jobs.get_job_manager().wait(first.json["job_id"], timeout=5)["status"] == "succeeded"
@@ -0,0 +1,27 @@
+import math
+
+from google_places_enricher_2_0.collector import PlaceCollector
+from google_places_enricher_2_0.utils import extract_establishment_rows
+
+
+def test_place_collector_merges_duplicates():
+    collector = PlaceCollector()
+    collector.add(extract_establishment_rows([{"id": "b"}, {"id": "a", "rating": 4.0}], "cafe"), (1.0, 2.0))
+    # Second hit of "b" fills its missing location and adds a category
+    collector.add(extract_establishment_rows(
+        [{"id": "b", "location": {"latitude": 5.0, "longitude": 6.0}}, {"id": "c"}], "bar"
+    ), (1.5, 2.0))
+    collector.add(extract_establishment_rows([{"id": "b"}], "cafe"), (1.5, 2.0))
+
+    df = collector.to_frame()
+    assert list(df["place_id"]) == ["a", "b", "c"]
+    assert str(df.loc[1, "categories"]) == "['cafe' 'bar']"
+    assert (df.loc[1, "lat"], df.loc[1, "lon"]) == (5.0, 6.0)
+    assert math.isnan(df.loc[2, "lat"]) and df.loc[0, "rating"] == 4.0
+
+    report = collector.cell_report()
+    assert report.to_dict("list") == {
+        "lat": [1.0, 1.5], "lon": [2.0, 2.0], "hits": [2, 3], "duplicates": [0, 2],
+        "duplicate_ratio": [0.0, 0.667],
+    }
+    assert collector.stats()["duplicate_ratio"] == 0.4
@@ -0,0 +1,42 @@
+import json
+import os
+
+import pytest
+
+from google_places_enricher_2_0 import config as app_config
+
+
+@pytest.fixture
+def config_path(tmp_path, monkeypatch):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"RADIUS": 100}))
+    monkeypatch.setattr(app_config, "CONFIG_PATH", str(path))
+    return path
+
+
+def test_config_is_parsed_once(config_path, monkeypatch):
+    assert app_config.get_config_value("RADIUS") == 100
+    calls = []
+    monkeypatch.setattr(app_config, "_read_config", lambda: calls.append(1) or {})
+    for _ in range(100):
+        assert app_config.get_config_value("RADIUS") == 100
+    assert calls == []
+
+
+def test_config_reloads_external_changes(config_path, monkeypatch):
+    monkeypatch.setattr(app_config, "CONFIG_CHECK_INTERVAL", 0)
+    assert app_config.get_config_value("RADIUS") == 100
+    config_path.write_text(json.dumps({"RADIUS": 25000}))
+    os.utime(config_path, ns=(1, 1))
+    assert app_config.get_config_value("RADIUS") == 25000
+    # Missing keys are still filled in with the defaults
+    assert app_config.get_config_value("TILING") == "square"
+
+
+def test_set_config_values_writes_once(config_path):
+    app_config.set_config_values({"RADIUS": 500, "TILING": "hexagonal"})
+    stored = json.loads(config_path.read_text())
+    assert stored["RADIUS"] == 500 and stored["TILING"] == "hexagonal"
+    assert app_config.load_config()["TILING"] == "hexagonal"
+    # No temporary file is left next to the config
+    assert os.listdir(config_path.parent) == ["config.json"]
@@ -0,0 +1,57 @@
+import os
+
+import pandas as pd
+import pytest
+
+import google_places_enricher_2_0.config as app_config
+from google_places_enricher_2_0.dataset_io import parquet_path, read_dataset, write_dataset
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_config, "CONFIG_PATH", str(tmp_path / "config.json"))
+    app_config.set_config_values({"PARQUET_OUTPUT": True, "PARQUET_ROW_GROUP_SIZE": 2})
+
+
+def test_write_dataset_parquet_row_groups(tmp_path, config):
+    df = pd.DataFrame({
+        "place_id": ["a", "b", "c", "d", "e"],
+        "categories": ["['cafe']", "['bar' 'cafe']", "['bar']", "['bar']", "['cafe']"],
+        "lat": [1.0, 2.0, None, 4.0, 5.0],
+        "price_level": [None] * 5,
+    })
+    csv_path = str(tmp_path / "establishments.csv")
+    write_dataset(df, csv_path)
+
+    assert pq.ParquetFile(parquet_path(csv_path)).num_row_groups == 3
+    df_read = read_dataset(csv_path)
+    pd.testing.assert_frame_equal(df_read, df)
+    assert df_read["lat"].dtype == "float64"
+
+
+def test_read_dataset_prefers_newer_csv(tmp_path, config):
+    csv_path = str(tmp_path / "establishments.csv")
+    write_dataset(pd.DataFrame({"place_id": ["a"]}), csv_path)
+    # Dataset uploaded again as csv after the Parquet file was written
+    pd.DataFrame({"place_id": ["b"]}).to_csv(csv_path, index=False)
+    later = os.path.getmtime(parquet_path(csv_path)) + 10
+    os.utime(csv_path, (later, later))
+    assert read_dataset(csv_path)["place_id"].tolist() == ["b"]
+
+    app_config.set_config_value("PARQUET_OUTPUT", False)
+    write_dataset(pd.DataFrame({"place_id": ["c"]}), csv_path)
+    assert not os.path.exists(parquet_path(csv_path))
+
+
+def test_write_dataset_keeps_csv_when_arrow_fails(tmp_path, config):
+    csv_path = str(tmp_path / "enriched.csv")
+    write_dataset(pd.DataFrame({"a": [1, 2]}), csv_path)
+    assert os.path.exists(parquet_path(csv_path))
+
+    # A column mixing types has no Arrow schema
+    write_dataset(pd.DataFrame({"a": [1, "x", None]}), csv_path)
+    assert not os.path.exists(parquet_path(csv_path))
+    assert not os.path.exists(parquet_path(csv_path) + ".tmp")
+    assert read_dataset(csv_path)["a"].tolist()[:2] == ["1", "x"]
@@ -0,0 +1,31 @@
+import numpy as np
+
+from google_places_enricher_2_0.embedding_store import EmbeddingStore
+
+
+class FakeModel:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, phrases, convert_to_numpy=True):
+        self.encoded.extend(phrases)
+        return np.array([[len(p), p.count("a"), 1.0] for p in phrases], dtype=np.float32)
+
+
+def test_embedding_store_encodes_missing_phrases_once(tmp_path):
+    model = FakeModel()
+    store = EmbeddingStore("org/some model", path=str(tmp_path))
+    first = store.encode(["pizza", "bar", "pizza"], model)
+    assert model.encoded == ["pizza", "bar"]
+    assert first.tolist() == [[5, 1, 1], [3, 1, 1], [5, 1, 1]]
+
+    # Only the new phrase is encoded, the others come from the memory map
+    second = store.encode(["bar", "cafe"], model)
+    assert model.encoded == ["pizza", "bar", "cafe"]
+    assert second.tolist() == [[3, 1, 1], [4, 1, 1]]
+
+    # A new process reuses the store written to disk
+    reopened = EmbeddingStore("org/some model", path=str(tmp_path))
+    assert len(reopened) == 3
+    assert reopened.encode(["cafe", "pizza"], FakeModel()).tolist() == [[4, 1, 1], [5, 1, 1]]
+    assert (tmp_path / "org_some_model" / "vectors.npy").exists()
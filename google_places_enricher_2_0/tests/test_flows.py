@@ -0,0 +1,269 @@
+import json
+import random
+import time
+
+import pandas as pd
+import pytest
+
+import google_places_enricher_2_0.config as app_config
+import google_places_enricher_2_0.flows as flows
+from google_places_enricher_2_0.jobs import Job, JobStore
+from google_places_enricher_2_0.rate_limiter import RateLimiter
+from google_places_enricher_2_0.response_cache import ResponseCache
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # flows.py reads and writes ./static/... relative to the working directory
+    (tmp_path / "static" / "data" / "output").mkdir(parents=True)
+    (tmp_path / "static" / "data" / "input").mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app_config, "CONFIG_PATH", str(tmp_path / "config.json"))
+    with open(app_config.CONFIG_PATH, "w") as f:
+        json.dump({"API_KEY": "dummy_key", "RADIUS": 1000}, f)
+    pd.DataFrame({"lat": [1.0, 2.0, 3.0], "lon": [4.0, 5.0, 6.0]}).to_csv(
+        "static/data/output/lat_lon_calculated.csv", sep=";", index=False
+    )
+    pd.DataFrame({"category": ["cafe", "bar"]}).to_csv(
+        "static/data/input/categories_request.csv", sep=";", index=False
+    )
+    return tmp_path
+
+
+def fake_place(lat, lon, cat):
+    return {
+        "id": f"place-{lat}-{lon}",
+        "location": {"latitude": lat, "longitude": lon},
+        "businessStatus": "OPERATIONAL",
+        "displayName": {"text": f"{cat} at {lat}"},
+        "types": [cat, "point_of_interest"],
+    }
+
+
+def fake_make_request(url, params=None, method="GET", headers=None, **kwargs):
+    # Finish out of order so the test catches any reordering of results
+    time.sleep(random.uniform(0, 0.01))
+    center = params["locationBias"]["circle"]["center"]
+    return {"places": [fake_place(center["latitude"], center["longitude"], params["textQuery"])]}
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_request_google_places_keeps_serial_order(workdir, mocker, workers):
+    app_config.set_config_value("REQUEST_WORKERS", workers)
+    mocker.patch.object(flows, "make_request", side_effect=fake_make_request)
+
+    assert flows.request_google_places() == "Execution went successfully."
+
+    # Every place is found by both categories; their order follows the
+    # categories file only if the responses are consumed in serial order.
+    df = pd.read_csv(workdir / "static" / "data" / "output" / "establishments.csv")
+    assert len(df) == 3
+    assert df["categories"].tolist() == ["['cafe' 'bar']"] * 3
+    # The duplicate report is not listed among the datasets
+    assert (workdir / "static" / "data" / "cache" / "cell_duplicates.csv").exists()
+    assert not (workdir / "static" / "data" / "output" / "cell_duplicates.csv").exists()
+
+
+def test_request_google_places_stops_on_error(workdir, mocker):
+    app_config.set_config_value("REQUEST_WORKERS", 2)
+    mocker.patch.object(
+        flows, "make_request",
+        return_value={"status": "ERROR", "error_message": "quota"}
+    )
+
+    assert flows.request_google_places() == "Error: quota"
+    assert not (workdir / "static" / "data" / "output" / "establishments.csv").exists()
+
+
+def test_make_request_retries_quota_errors(workdir, mocker):
+    app_config.set_config_value("RETRY_BACKOFF_SECONDS", 0)
+    throttled = mocker.Mock(status_code=429, url="u")
+    throttled.json.return_value = {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}
+    ok = mocker.Mock(status_code=200, url="u")
+    ok.json.return_value = {"places": []}
+    client = mocker.patch.object(flows, "get_places_client").return_value
+    client.request.side_effect = [throttled, ok]
+    limiter = RateLimiter(100)
+
+    assert flows.make_request("u", params={}, method="POST", limiter=limiter) == {"places": []}
+    assert client.request.call_count == 2
+    assert limiter.stats()["throttled"] == 1
+
+
+def test_request_google_places_resumes_from_checkpoint(workdir, mocker):
+    app_config.set_config_value("REQUEST_WORKERS", 1)
+
+    def fail_on_third_point(url, params=None, **kwargs):
+        if params["locationBias"]["circle"]["center"]["latitude"] == 3.0:
+            return {"status": "ERROR", "error_message": "quota"}
+        return fake_make_request(url, params=params)
+
+    mocker.patch.object(flows, "make_request", side_effect=fail_on_third_point)
+    assert flows.request_google_places() == "Error: quota"
+
+    resumed = mocker.patch.object(flows, "make_request", side_effect=fake_make_request)
+    assert flows.request_google_places(resume=True) == "Execution went successfully."
+    # Only the two searches of the failed point are requested again
+    assert resumed.call_count == 2
+    df = pd.read_csv(workdir / "static" / "data" / "output" / "establishments.csv")
+    assert len(df) == 3
+
+
+def test_make_request_uses_response_cache(workdir, mocker):
+    ok = mocker.Mock(status_code=200, url="u")
+    ok.json.return_value = {"places": [{"id": "1"}]}
+    client = mocker.patch.object(flows, "get_places_client").return_value
+    client.request.return_value = ok
+
+    with ResponseCache(str(workdir / "cache.sqlite3")) as cache:
+        for _ in range(3):
+            response = flows.make_request("u", params={"textQuery": "cafe"}, method="POST", cache=cache)
+            assert response == {"places": [{"id": "1"}]}
+        assert client.request.call_count == 1
+        assert cache.stats()["hits"] == 2
+
+
+def test_request_places_pages_follows_page_tokens(workdir, mocker):
+    pages = {
+        None: {"places": [{"id": "1"}], "nextPageToken": "t1"},
+        "t1": {"places": [{"id": "2"}], "nextPageToken": "t2"},
+        "t2": {"places": [{"id": "3"}]},
+    }
+    make_request = mocker.patch.object(
+        flows, "make_request",
+        side_effect=lambda url, params=None, **kwargs: pages[params.get("pageToken")]
+    )
+
+    response = flows.request_places_pages(1.0, 2.0, "cafe", max_pages=3)
+    assert [p["id"] for p in response["places"]] == ["1", "2", "3"]
+    assert response["nextPageToken"] is None
+
+    make_request.reset_mock()
+    response = flows.request_places_pages(1.0, 2.0, "cafe", max_pages=2)
+    assert [p["id"] for p in response["places"]] == ["1", "2"]
+    assert response["nextPageToken"] == "t2"
+    assert make_request.call_count == 2
+
+
+def test_request_places_pages_accepts_empty_results(workdir, mocker):
+    mocker.patch.object(flows, "make_request", return_value={})
+    assert flows.request_places_pages(1.0, 2.0, "cafe", max_pages=3)["places"] == []
+
+
+def test_request_google_places_adaptive_subdivides_saturated_cells(workdir, mocker):
+    app_config.set_config_value("ADAPTIVE_MAX_DEPTH", 2)
+    pd.DataFrame({"lat": [1.0], "lon": [4.0]}).to_csv(
+        "static/data/output/lat_lon_calculated.csv", sep=";", index=False
+    )
+    pd.DataFrame({"category": ["cafe"]}).to_csv(
+        "static/data/input/categories_request.csv", sep=";", index=False
+    )
+
+    def dense_area(url, params=None, **kwargs):
+        circle = params["locationBias"]["circle"]
+        response = fake_make_request(url, params=params)
+        # Circles bigger than 600m have more results than a single page
+        if circle["radius"] > 600:
+            response["nextPageToken"] = "more"
+        return response
+
+    make_request = mocker.patch.object(flows, "make_request", side_effect=dense_area)
+    assert flows.request_google_places(max_pages=1, adaptive=True) == "Execution went successfully."
+
+    radii = [call.kwargs["params"]["locationBias"]["circle"]["radius"] for call in make_request.call_args_list]
+    # 1000m saturates -> 4 x 707m saturate -> 16 x 500m
+    assert radii == [1000.0] + [pytest.approx(707.1, abs=0.1)] * 4 + [pytest.approx(500.0)] * 16
+    df = pd.read_csv(workdir / "static" / "data" / "output" / "establishments.csv")
+    assert len(df) == 21
+
+
+def test_request_google_places_reports_progress_and_stops_when_cancelled(workdir, mocker):
+    app_config.set_config_value("REQUEST_WORKERS", 1)
+    mocker.patch.object(flows, "make_request", side_effect=fake_make_request)
+    store = JobStore(str(workdir / "jobs.sqlite3"))
+
+    job = Job("done", "enrichment", store)
+    assert flows.request_google_places(job=job) == "Execution went successfully."
+    assert (job.total, job.done) == (6, 6)
+
+    job = Job("cancelled", "enrichment", store)
+    original_advance = job.advance
+    def advance_and_cancel(count=1):
+        original_advance(count)
+        if job.done == 2:
+            job._cancel.set()
+    job.advance = advance_and_cancel
+    assert flows.request_google_places(job=job).startswith("Cancelled")
+    assert job.done == 2
+
+
+def test_request_google_places_adaptive_saturates_on_full_last_page(workdir, mocker):
+    app_config.set_config_value("ADAPTIVE_MAX_DEPTH", 1)
+    pd.DataFrame({"lat": [1.0], "lon": [4.0]}).to_csv(
+        "static/data/output/lat_lon_calculated.csv", sep=";", index=False
+    )
+    pd.DataFrame({"category": ["cafe"]}).to_csv(
+        "static/data/input/categories_request.csv", sep=";", index=False
+    )
+
+    def dense_area(url, params=None, **kwargs):
+        circle = params["locationBias"]["circle"]
+        if circle["radius"] <= 600:
+            return fake_make_request(url, params=params)
+        # Like the API: 3 full pages, the last one without a nextPageToken
+        page = {None: 0, "p1": 1, "p2": 2}[params.get("pageToken")]
+        center = circle["center"]
+        places = [
+            dict(fake_place(center["latitude"], center["longitude"], "cafe"), id=f"dense-{page}-{i}")
+            for i in range(flows.API_PAGE_SIZE)
+        ]
+        response = {"places": places}
+        if page < 2:
+            response["nextPageToken"] = f"p{page + 1}"
+        return response
+
+    make_request = mocker.patch.object(flows, "make_request", side_effect=dense_area)
+    assert flows.request_google_places(adaptive=True) == "Execution went successfully."
+
+    radii = [call.kwargs["params"]["locationBias"]["circle"]["radius"] for call in make_request.call_args_list]
+    # 3 pages of 1000m saturate -> 4 x 707m searches, 3 pages each
+    assert radii == [1000.0] * 3 + [pytest.approx(707.1, abs=0.1)] * 12
+
+
+def test_request_places_pages_retries_expired_token_of_cached_page(workdir, mocker):
+    pages = {
+        None: [{"places": [{"id": "1"}], "nextPageToken": "old"}, {"places": [{"id": "1"}], "nextPageToken": "new"}],
+        "old": [{"error": {"code": 400, "status": "INVALID_ARGUMENT"}}],
+        "new": [{"places": [{"id": "2"}]}],
+    }
+    def respond(url, params=None, **kwargs):
+        body = pages[params.get("pageToken")]
+        response = mocker.Mock(status_code=400 if "error" in body[0] else 200, url=url)
+        response.json.return_value = body.pop(0) if len(body) > 1 else body[0]
+        return response
+    client = mocker.patch.object(flows, "get_places_client").return_value
+    client.request.side_effect = respond
+
+    with ResponseCache(str(workdir / "cache.sqlite3")) as cache:
+        flows.request_places_pages(1.0, 2.0, "cafe", cache=cache, max_pages=1)
+        # The cached first page hands out the expired "old" token
+        response = flows.request_places_pages(1.0, 2.0, "cafe", cache=cache, max_pages=2)
+        assert [p["id"] for p in response["places"]] == ["1", "2"]
+        tokens = [call.kwargs["params"].get("pageToken") for call in client.request.call_args_list]
+        assert tokens == [None, "old", None, "new"]
+
+        # The refreshed pages were stored
+        client.request.reset_mock()
+        response = flows.request_places_pages(1.0, 2.0, "cafe", cache=cache, max_pages=2)
+        assert [p["id"] for p in response["places"]] == ["1", "2"]
+        assert client.request.call_count == 0
+
+
+def test_request_places_pages_returns_errors_of_fresh_pages(workdir, mocker):
+    responses = [{"places": [{"id": "1"}], "nextPageToken": "t1"}, {"error": {"code": 400, "status": "INVALID_ARGUMENT"}}]
+    make_request = mocker.patch.object(flows, "make_request", side_effect=responses)
+
+    with ResponseCache(str(workdir / "cache.sqlite3")) as cache:
+        response = flows.request_places_pages(1.0, 2.0, "cafe", cache=cache, max_pages=2)
+    assert response == responses[1]
+    assert make_request.call_count == 2
@@ -0,0 +1,126 @@
+import numpy as np
+import pyproj
+import pytest
+import shapely.geometry
+
+from google_places_enricher_2_0.grid import (
+    LATTICES, area_bounds, build_grid, compare_tilings, generate_grid, hexagonal_lattice, lattice_axis,
+    lattice_coverage, parse_area, project_box, subdivide_circles, tiling_report, write_coordinates
+)
+
+
+def legacy_grid_csv(radius, southwest_lat, southwest_lon, northeast_lat, northeast_lon):
+    # Scalar implementation calculate_coordinates used before the grid was vectorized
+    to_proxy_transformer = pyproj.Transformer.from_crs("epsg:4326", "epsg:3857")
+    to_original_transformer = pyproj.Transformer.from_crs("epsg:3857", "epsg:4326")
+    sw = shapely.geometry.Point(southwest_lat, southwest_lon)
+    ne = shapely.geometry.Point(northeast_lat, northeast_lon)
+    stepsize = radius + (radius / 2)
+    transformed_sw = to_proxy_transformer.transform(sw.x, sw.y)
+    transformed_ne = to_proxy_transformer.transform(ne.x, ne.y)
+    lines = ["lat;lon\n"]
+    x = transformed_sw[0] + (3 / 4 * radius)
+    while x < transformed_ne[0]:
+        y = transformed_sw[1] + (3 / 4 * radius)
+        while y < transformed_ne[1]:
+            p = shapely.geometry.Point(to_original_transformer.transform(x, y))
+            lines.append("{:f};{:f}\n".format(p.x, p.y))
+            y += stepsize
+        x += stepsize
+    return "".join(lines)
+
+
+@pytest.mark.parametrize("box", [
+    (4444, -25.512242704374355, -49.32304693059921, -25.329914975179992, -49.20322728948593),
+    (333.3, -25.512242704374355, -49.32304693059921, -25.329914975179992, -49.20322728948593),
+    (1000, 40.70, -74.02, 40.80, -73.93),
+    (5000, 10.0, 10.0, 10.01, 10.01),
+])
+def test_square_grid_matches_legacy_output(tmp_path, box):
+    path = tmp_path / "lat_lon_calculated.csv"
+    write_coordinates(str(path), *generate_grid(*box))
+    assert path.read_text() == legacy_grid_csv(*box)
+
+
+def test_lattice_axis_matches_loop():
+    values, x = [], 0.1
+    while x < 100.0:
+        values.append(x)
+        x += 0.7
+    np.testing.assert_array_equal(lattice_axis(0.1, 100.0, 0.7), values)
+    assert lattice_axis(5.0, 1.0, 0.7).size == 0
+
+
+@pytest.mark.parametrize("radius", [100, 750, 4444])
+def test_hexagonal_lattice_covers_the_area(radius):
+    box = (0.0, 0.0, 10000.0, 7000.0)
+    xs, ys = hexagonal_lattice(radius, *box)
+    assert lattice_coverage(radius, xs, ys, box)["coverage"] == 1.0
+
+
+def test_tiling_report_compares_tilings():
+    report = tiling_report(1000, -25.51, -49.32, -25.33, -49.20)
+    assert set(report) == {"square", "hexagonal"}
+    # The square lattice leaves gaps in the middle of its cells
+    assert report["square"]["coverage"] < 1.0
+    assert report["hexagonal"]["coverage"] == 1.0
+    assert report["hexagonal"]["overlap_ratio"] < report["square"]["overlap_ratio"] * 1.5
+
+
+def test_generate_grid_rejects_unknown_tiling():
+    with pytest.raises(ValueError):
+        generate_grid(1000, 0.0, 0.0, 0.1, 0.1, tiling="triangular")
+
+
+def test_subdivide_circles_covers_parent_quadrants():
+    lats, lons, radii = subdivide_circles([-25.4], [-49.2], [1000.0])
+    assert len(lats) == len(lons) == len(radii) == 4
+    np.testing.assert_allclose(radii, 1000.0 / np.sqrt(2))
+    # Each child is half a radius away from the parent on both axes (ground meters)
+    geod = pyproj.Geod(ellps="WGS84")
+    _, _, distances = geod.inv(np.full(4, -49.2), np.full(4, -25.4), lons, lats)
+    np.testing.assert_allclose(distances, 1000.0 / np.sqrt(2), rtol=0.01)
+
+
+TRIANGLE = {
+    "type": "Polygon",
+    "coordinates": [[[-49.32, -25.51], [-49.20, -25.51], [-49.32, -25.33], [-49.32, -25.51]]],
+}
+
+
+def test_generate_grid_keeps_points_reaching_polygon():
+    area = parse_area({"type": "Feature", "geometry": TRIANGLE})
+    box = area_bounds(area)
+    box_lats, _ = generate_grid(500, *box, tiling="hexagonal")
+    lats, lons = generate_grid(500, *box, tiling="hexagonal", area=area)
+    assert 0 < len(lats) < 0.7 * len(box_lats)
+
+    report = tiling_report(500, *box, area=area)["hexagonal"]
+    assert report["points"] == len(lats)
+    assert report["points_saved"] == len(box_lats) - len(lats)
+    assert report["coverage"] == 1.0
+
+
+@pytest.mark.parametrize("geojson", [
+    {"type": "Point", "coordinates": [0, 0]},
+    {"type": "Polygon", "coordinates": []},
+    "not geojson",
+])
+def test_parse_area_rejects_non_polygons(geojson):
+    with pytest.raises(ValueError):
+        parse_area(geojson)
+
+
+def test_compare_tilings_reuses_built_grids(mocker):
+    box = project_box(-25.51, -49.32, -25.33, -49.20)
+    built = []
+    for tiling, lattice in list(LATTICES.items()):
+        def counted(*args, tiling=tiling, lattice=lattice):
+            built.append(tiling)
+            return lattice(*args)
+        mocker.patch.dict(LATTICES, {tiling: counted})
+
+    grid = build_grid(1000, box, "hexagonal")
+    report = compare_tilings(1000, box, grids={"hexagonal": grid})
+    assert built == ["hexagonal", "square"]
+    assert report == tiling_report(1000, -25.51, -49.32, -25.33, -49.20)
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from google_places_enricher_2_0.jobs import JobManager, JobStore
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return JobManager(JobStore(str(tmp_path / "jobs.sqlite3")), workers=1)
+
+
+def test_job_reports_progress_and_result(manager):
+    def task(job, steps):
+        job.add_total(steps)
+        for _ in range(steps):
+            job.advance()
+        return {"steps": steps}
+
+    job = manager.submit("test", task, 3)
+    status = manager.wait(job.id, timeout=5)
+    assert status["status"] == "succeeded"
+    assert (status["total"], status["done"], status["progress"]) == (3, 3, 1.0)
+    assert manager.result(job.id) == {"steps": 3}
+    assert manager.active() == []
+
+
+def test_failed_job_keeps_its_error(manager):
+    def task(job):
+        raise ValueError("broken")
+
+    job = manager.submit("test", task)
+    status = manager.wait(job.id, timeout=5)
+    assert status["status"] == "failed"
+    assert status["error"] == "broken"
+    assert manager.result(job.id) is None
+
+
+def test_cancel_running_and_queued_jobs(manager):
+    started = threading.Event()
+
+    def task(job):
+        job.add_total(100)
+        job.advance(10)
+        started.set()
+        while True:
+            job.check_cancelled()
+            time.sleep(0.01)
+
+    running = manager.submit("test", task)
+    # A single worker, so the second job waits in the queue
+    queued = manager.submit("test", task)
+    try:
+        assert started.wait(timeout=5)
+        status = manager.status(running.id)
+        assert status["status"] == "running"
+        assert (status["done"], status["progress"]) == (10, 0.1)
+        assert status["eta_seconds"] is not None
+    finally:
+        assert manager.cancel(queued.id)
+        assert manager.cancel(running.id)
+
+    assert manager.wait(running.id, timeout=5)["status"] == "cancelled"
+    status = manager.wait(queued.id, timeout=5)
+    assert status["status"] == "cancelled"
+    assert status["started_at"] is None
+    assert not manager.cancel(running.id)
+
+
+def test_unfinished_jobs_are_failed_on_restart(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    store.insert("lost", "enrichment")
+    store.update("lost", status="running")
+
+    row = JobStore(str(tmp_path / "jobs.sqlite3")).get("lost")
+    assert row["status"] == "failed"
+    assert row["error"] == "Interrupted by a restart"
+
+
+def test_store_keeps_only_recent_finished_jobs(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), retention=2)
+    store.insert("running", "matching")
+    store.update("running", status="running")
+    for index in range(4):
+        store.insert(f"done-{index}", "matching")
+        store.update(f"done-{index}", status="succeeded", result={"rows": index})
+        time.sleep(0.01)
+
+    store.insert("queued", "matching")
+    assert [job["id"] for job in store.list()] == ["queued", "done-3", "done-2", "running"]
+    assert store.get("done-0") is None
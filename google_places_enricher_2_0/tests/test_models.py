@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+import torch
+
+import google_places_enricher_2_0.config as app_config
+import google_places_enricher_2_0.models as models
+
+
+@pytest.fixture
+def fake_model(tmp_path, monkeypatch, mocker):
+    monkeypatch.setattr(app_config, "CONFIG_PATH", str(tmp_path / "config.json"))
+    app_config.set_config_values({"MODEL_NAME": "test-model", "MODEL_DEVICE": "cpu"})
+    monkeypatch.setattr(models, "_models", {})
+
+    def slow_load(name, device=None):
+        time.sleep(0.05)
+        return mocker.Mock(name=name)
+
+    return mocker.patch.object(models, "SentenceTransformer", side_effect=slow_load)
+
+
+def test_get_sentence_model_loads_once(fake_model):
+    loaded = []
+    threads = [threading.Thread(target=lambda: loaded.append(models.get_sentence_model())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    fake_model.assert_called_once_with("test-model", device="cpu")
+    assert all(model is loaded[0] for model in loaded)
+    assert models.get_sentence_model() is loaded[0]
+
+
+def test_warm_up_model(fake_model):
+    assert not models.is_model_loaded()
+    models.warm_up_model().join()
+    assert models.is_model_loaded()
+    assert fake_model.call_count == 1
+
+
+def test_get_sentence_model_int8_backend(fake_model):
+    fake_model.side_effect = lambda name, device=None: torch.nn.Sequential(torch.nn.Linear(4, 2))
+    model = models.get_sentence_model(backend="torch-int8")
+
+    assert isinstance(model[0], torch.ao.nn.quantized.dynamic.Linear)
+    assert models.is_model_loaded(backend="torch-int8") and not models.is_model_loaded()
+    assert models.model_key(backend="torch-int8") == "test-model@torch-int8"
+    with pytest.raises(ValueError):
+        models.get_sentence_model(backend="tensorrt")
+
+
+def test_get_sentence_model_onnx_file_is_part_of_the_key(fake_model):
+    fake_model.side_effect = lambda name, device=None, backend=None, model_kwargs=None: object()
+    app_config.set_config_values({"MODEL_BACKEND": "onnx", "MODEL_ONNX_FILE": "onnx/model.onnx"})
+    assert models.model_key() == "test-model@onnx:onnx/model.onnx"
+    first = models.get_sentence_model()
+
+    app_config.set_config_value("MODEL_ONNX_FILE", "onnx/model_qint8_avx512.onnx")
+    assert models.model_key() == "test-model@onnx:onnx/model_qint8_avx512.onnx"
+    assert not models.is_model_loaded()
+    second = models.get_sentence_model()
+    assert second is not first
+    assert fake_model.call_args.kwargs["model_kwargs"] == {"file_name": "onnx/model_qint8_avx512.onnx"}
+
+    app_config.set_config_value("MODEL_ONNX_FILE", "")
+    assert models.model_key() == "test-model@onnx"
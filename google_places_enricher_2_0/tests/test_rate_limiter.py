@@ -0,0 +1,35 @@
+import time
+
+from google_places_enricher_2_0.rate_limiter import RateLimiter
+
+
+def test_rate_limiter_enforces_budget():
+    limiter = RateLimiter(1000, budget=3)
+    assert [limiter.acquire() for _ in range(4)] == [True, True, True, False]
+    assert limiter.stats()["requests"] == 3
+
+
+def test_rate_limiter_paces_requests():
+    limiter = RateLimiter(50, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    # First token is already in the bucket, the other five take 20ms each
+    assert time.monotonic() - start >= 0.09
+    assert limiter.stats()["wait_total"] > 0
+
+
+def test_rate_limiter_backoff_and_recover():
+    limiter = RateLimiter(20)
+    limiter.backoff()
+    assert limiter.rate == 10
+    for _ in range(100):
+        limiter.recover()
+    assert limiter.rate == 20
+
+
+def test_rate_limiter_zero_rate_is_unthrottled():
+    limiter = RateLimiter(0, budget=5)
+    limiter.backoff()
+    assert [limiter.acquire() for _ in range(6)] == [True] * 5 + [False]
+    assert limiter.stats()["wait_max"] == 0.0
@@ -0,0 +1,32 @@
+from google_places_enricher_2_0.response_cache import ResponseCache, cache_key
+
+
+def test_cache_key_ignores_api_key():
+    payload = {"textQuery": "cafe"}
+    mask = {"X-Goog-FieldMask": "places.id"}
+    assert cache_key("u", {**mask, "X-Goog-Api-Key": "a"}, payload) == \
+        cache_key("u", {**mask, "X-Goog-Api-Key": "b"}, payload)
+    assert cache_key("u", mask, payload) != cache_key("u", mask, {"textQuery": "bar"})
+
+
+def test_cache_hit_miss_and_ttl(tmp_path):
+    with ResponseCache(str(tmp_path / "cache.sqlite3"), ttl=60) as cache:
+        assert cache.get("k") is None
+        cache.set("k", {"places": [{"id": "1"}]})
+        assert cache.get("k") == {"places": [{"id": "1"}]}
+        cache.ttl = -1
+        assert cache.get("k") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 2
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    with ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=100) as cache:
+        cache.set("a", {"v": "x" * 30})
+        cache.set("b", {"v": "y" * 30})
+        cache.get("a")
+        cache.set("c", {"v": "z" * 30})
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        assert cache.stats()["size"] <= 100
@@ -0,0 +1,174 @@
+import math
+import zlib
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from sentence_transformers import util
+
+import google_places_enricher_2_0.ann_index as ann_index
+import google_places_enricher_2_0.config as app_config
+import google_places_enricher_2_0.utils as utils
+from google_places_enricher_2_0.utils import (
+    ESTABLISHMENT_LABELS,
+    build_establishment_phrases,
+    create_estab_phrase,
+    extract_establishment_rows,
+    intern_estab_phrases,
+    top_k_similarities
+)
+
+
+def test_extract_establishment_rows():
+    places = [
+        {
+            "id": "p1",
+            "displayName": {"text": "Bakery"},
+            "businessStatus": "OPERATIONAL",
+            "location": {"latitude": -25.4, "longitude": -49.2},
+            "types": ["bakery", "store"],
+            "rating": 4.5,
+            "userRatingCount": 10,
+            "formattedAddress": "Rua A, 1",
+        },
+        # Malformed name: only that column is left empty
+        {"id": "p2", "displayName": "Cafe"},
+    ]
+    rows = extract_establishment_rows(places, "bakery")
+    first, second = (dict(zip(ESTABLISHMENT_LABELS, row)) for row in rows)
+    assert first == {
+        "business_status": "OPERATIONAL",
+        "lat": -25.4,
+        "lon": -49.2,
+        "name": "Bakery",
+        "opening_hours": None,
+        "place_id": "p1",
+        "price_level": None,
+        "rating": 4.5,
+        "types": "bakery, store",
+        "user_ratings_total": 10,
+        "vicinity": "Rua A, 1",
+        "category": "bakery",
+    }
+    assert second["place_id"] == "p2" and second["name"] is None
+    assert math.isnan(second["lat"]) and second["category"] == "bakery"
+
+
+def test_top_k_similarities_matches_full_sort():
+    torch.manual_seed(0)
+    cosine_scores = torch.rand(6, 50)
+    cosine_scores[0, 3] = cosine_scores[0, 7] = 2.0
+
+    indices, scores = top_k_similarities(cosine_scores, 5)
+    assert indices.shape == scores.shape == (6, 5)
+    for i, row in enumerate(cosine_scores.tolist()):
+        expected = sorted(range(50), key=lambda j: row[j], reverse=True)[:5]
+        assert sorted(indices[i].tolist()) == sorted(expected)
+        assert list(scores[i]) == sorted(scores[i], reverse=True)
+
+    # Without k every column is kept, ties in the original order
+    indices, scores = top_k_similarities(cosine_scores, 0)
+    assert indices.shape == (6, 50) and indices[0, :2].tolist() == [3, 7]
+
+
+def test_build_establishment_phrases():
+    sim_df = pd.DataFrame({
+        "estab_idx": [0, 0, 0, 2, 2],
+        "yelp_idx": [4, 1, 2, 0, 3],
+        "score": [0.9, float("nan"), 0.95, 0.2, 0.2],
+    })
+    phrases = build_establishment_phrases(["food", "bar", "cafe"], ["a b", "c d", "e f"], sim_df)
+
+    assert [p["phrase"] for p in phrases] == ["a b", "c d", "e f"]
+    assert phrases[0]["options"] == [
+        {"category_index": 2, "score": 0.95},
+        {"category_index": 4, "score": 0.9},
+        {"category_index": 1, "score": -1.0},
+    ]
+    assert phrases[0]["best_score"] == phrases[0]["selected_score"] == 0.95
+    assert phrases[1] == {"category": "bar", "phrase": "c d", "best_score": -1.0, "selected_score": -1.0,
+                          "selected_option": None, "options": []}
+    # Ties keep their order
+    assert [o["category_index"] for o in phrases[2]["options"]] == [0, 3]
+
+
+class FakeSentenceModel:
+    device = "cpu"
+
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, sentences, convert_to_tensor=True, convert_to_numpy=False):
+        self.batches.append(len(sentences))
+        generator = torch.Generator().manual_seed(0)
+        table = torch.randn(1000, 8, generator=generator)
+        return torch.stack([table[zlib.crc32(s.encode()) % 1000] for s in sentences])
+
+
+@pytest.mark.parametrize("batch_size", [1, 3, 1024])
+def test_calculate_similarity_sentences_in_batches(tmp_path, monkeypatch, batch_size):
+    monkeypatch.setattr(app_config, "CONFIG_PATH", str(tmp_path / "config.json"))
+    app_config.set_config_values({"EMBEDDING_CACHE_ENABLED": False, "MATCH_BATCH_SIZE": batch_size})
+    model = FakeSentenceModel()
+    monkeypatch.setattr(utils, "get_sentence_model", lambda: model)
+    estab = [f"estab {i}" for i in range(7)]
+    yelp = [f"yelp {i}" for i in range(12)]
+
+    sim_df = utils.calculate_similarity_sentences(estab, yelp, top_k=4)
+
+    full = util.cos_sim(model.encode(estab), model.encode(yelp))
+    expected_scores, expected_indices = torch.topk(full, 4, dim=1)
+    assert sim_df["estab_idx"].tolist() == [i for i in range(7) for _ in range(4)]
+    assert sim_df["yelp_idx"].tolist() == expected_indices.ravel().tolist()
+    assert np.allclose(sim_df["score"], expected_scores.ravel().numpy(), atol=1e-6)
+    # Yelp sentences encoded once, establishment sentences by batches
+    assert model.batches[:-2] == [12] + [min(batch_size, 7 - i) for i in range(0, 7, batch_size)]
+
+
+def test_calculate_similarity_sentences_with_ann_index(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app_config, "CONFIG_PATH", str(tmp_path / "config.json"))
+    monkeypatch.setattr(ann_index, "_index", None)
+    app_config.set_config_values({"EMBEDDING_CACHE_ENABLED": False, "ANN_ENABLED": True,
+                                  "ANN_MIN_CATEGORIES": 1, "ANN_LISTS": 4, "ANN_PROBES": 4})
+    monkeypatch.setattr(utils, "get_sentence_model", FakeSentenceModel)
+    estab = [f"estab {i}" for i in range(7)]
+    yelp = [f"yelp {i}" for i in range(40)]
+
+    # Probing all the clusters gives the exact top-k
+    with_index = utils.calculate_similarity_sentences(estab, yelp, top_k=5)
+    assert (tmp_path / ann_index.ANN_INDEX_PATH).exists()
+    app_config.set_config_value("ANN_ENABLED", False)
+    exact = utils.calculate_similarity_sentences(estab, yelp, top_k=5)
+    assert with_index["yelp_idx"].tolist() == exact["yelp_idx"].tolist()
+    assert np.allclose(with_index["score"], exact["score"], atol=1e-6)
+
+
+def test_create_estab_phrase():
+    df = pd.DataFrame({
+        "place_id": ["a", "b", "c", "d"],
+        "categories": ["['cafe' 'coffee shop']", "['brewery, pub']", "Bakery", "['bar']"],
+        "types": ["cafe, food, point_of_interest, establishment", "bar", "point_of_interest", ""],
+    })
+    phrases = create_estab_phrase(df)
+    assert phrases.to_dict("list") == {
+        "place_id": ["a", "a", "b", "c", "d"],
+        "category": ["cafe", "coffee shop", "brewery, pub", "Bakery", "bar"],
+        "phrase_establishment": ["cafe cafe food", "coffee shop cafe food", "brewery pub bar", "Bakery", "bar "],
+    }
+
+
+def test_intern_estab_phrases():
+    df = pd.DataFrame({
+        "place_id": ["a", "b", "c", "d", "e"],
+        "categories": ["['cafe' 'bar']", "['bar']", "['cafe' 'bar']", None, "['bar']"],
+        "types": ["food", "food", "food", "food", "food"],
+    })
+    phrases, unique_phrases = intern_estab_phrases(df)
+    expected = create_estab_phrase(df)
+    pd.testing.assert_frame_equal(phrases.drop(columns="phrase_id"), expected)
+    # "bar food" is shared by a, b, c and e, and built only once
+    assert unique_phrases.tolist() == ["cafe food", "bar food"]
+    assert phrases["phrase_id"].tolist() == [0, 1, 1, 0, 1, 1]
+    assert (unique_phrases[phrases["phrase_id"]] == phrases["phrase_establishment"]).all()
@@ -1,11 +1,18 @@
+from google_places_enricher_2_0.ann_index import get_ann_index, phrases_fingerprint
 from google_places_enricher_2_0.config import get_config_value
-import requests
+from google_places_enricher_2_0.dataset_io import write_dataset
+from google_places_enricher_2_0.embedding_store import get_embedding_store
+from google_places_enricher_2_0.models import get_sentence_model, model_key
+from google_places_enricher_2_0.places_client import get_places_client
 import json
+import os
+import numpy as np
 import pandas as pd
-import re
-from sentence_transformers import SentenceTransformer, util
-import warnings
-from pandas.errors import SettingWithCopyWarning
+from sentence_transformers import util
+import torch
+
+# Kept out of static/data/output, whose csv files are all listed as datasets
+CELL_REPORT_PATH = './static/data/cache/cell_duplicates.csv'
 
 def read_file(name, path_file, sep=';'):
     """
@@ -40,13 +47,50 @@ def read_file(name, path_file, sep=';'):
     
     return df
 
-def initialize_variables_request():
+def _coordinate(establishment, key):
+    value = establishment.get("location", {}).get(key)
+    return float("nan") if value is None else float(value)
+
+# Field extractor table: column of establishments.csv -> accessor taking a
+# `places` entry of the Google Places response and the searched category.
+ESTABLISHMENT_FIELDS = (
+    ("business_status", lambda e, cat: e.get("businessStatus")),
+    ("lat", lambda e, cat: _coordinate(e, "latitude")),
+    ("lon", lambda e, cat: _coordinate(e, "longitude")),
+    ("name", lambda e, cat: e.get("displayName", {}).get("text")),
+    ("opening_hours", lambda e, cat: None),
+    ("place_id", lambda e, cat: e.get("id")),
+    ("price_level", lambda e, cat: e.get("priceLevel")),
+    ("rating", lambda e, cat: e.get("rating")),
+    ("types", lambda e, cat: ", ".join(e.get("types", []))),
+    ("user_ratings_total", lambda e, cat: e.get("userRatingCount")),
+    ("vicinity", lambda e, cat: e.get("formattedAddress")),
+    ("category", lambda e, cat: cat),
+)
+ESTABLISHMENT_LABELS = [label for label, _ in ESTABLISHMENT_FIELDS]
+_EXTRACTORS = tuple(extractor for _, extractor in ESTABLISHMENT_FIELDS)
+
+
+def _extract_field(extractor, establishment, cat):
+    try:
+        return extractor(establishment, cat)
+    except Exception:
+        return None
+
+
+def extract_establishment_rows(places, cat):
     """
-    Initializes the main variables used in the Google places API request.
+    Parses the establishments of a Google Places response into rows.
+
+    Each entry is read once through the ESTABLISHMENT_FIELDS table, a
+    malformed field only leaves its own column empty.
 
     Parameters
     ----------
-    No Parameters.
+    places: list
+        The `places` list of a Google Places API response.
+    cat: str
+        Category used in the search, stored in the `category` column.
 
     Raises
     ------
@@ -54,43 +98,21 @@ def initialize_variables_request():
 
     Returns
     -------
-    list, list
-        A list of lists, where each one corresponds to one of the fields treated in the
-        API's return, and a list of strings, corresponding to the names of these fields.
+    list
+        One tuple per establishment, with the values in ESTABLISHMENT_LABELS order.
     """
 
-    business_status,geometry,name,\
-    opening_hours,place_id,price_level,\
-    rating,types,user_ratings_total,\
-    vicinity,category = ([] for i in range(11))
-
-    establishments_features_data = [business_status, 
-                                    geometry, name, 
-                                    opening_hours, 
-                                    place_id, 
-                                    price_level, 
-                                    rating, 
-                                    types, 
-                                    user_ratings_total, 
-                                    vicinity, 
-                                    category]
-
-    establishments_features_labels = ['business_status', 
-                                    'geometry', 
-                                    'name', 
-                                    'opening_hours', 
-                                    'place_id', 
-                                    'price_level', 
-                                    'rating', 
-                                    'types', 
-                                    'user_ratings_total', 
-                                    'vicinity', 
-                                    'category']
-
-    return establishments_features_data, establishments_features_labels
-
-
-def create_places_post_request(lat, lon, cat):
+    rows = []
+    for establishment in places:
+        try:
+            row = tuple([extractor(establishment, cat) for extractor in _EXTRACTORS])
+        except Exception:
+            row = tuple([_extract_field(extractor, establishment, cat) for extractor in _EXTRACTORS])
+        rows.append(row)
+    return rows
+
+
+def create_places_post_request(lat, lon, cat, page_token=None, radius=None):
     """
     Creates the url that will be used to make the request to the Google places API.
 
@@ -102,6 +124,10 @@ def create_places_post_request(lat, lon, cat):
         Geographic coordinate longitude.
     cat: str
         Category for data enrichment.
+    page_token: str
+        Token of the result page to request, as returned in the previous page.
+    radius: float
+        Search radius in meters, defaults to the configured RADIUS.
 
     Raises
     ------
@@ -112,7 +138,7 @@ def create_places_post_request(lat, lon, cat):
     str
         Url for the request in the Google places API.
     """
-    RADIUS = get_config_value("RADIUS")
+    RADIUS = get_config_value("RADIUS") if radius is None else radius
     url = "https://places.googleapis.com/v1/places:searchText"
 
     payload = {
@@ -127,6 +153,8 @@ def create_places_post_request(lat, lon, cat):
             }
         }
     }
+    if page_token:
+        payload["pageToken"] = page_token
 
     headers = {
         "Content-Type": "application/json",
@@ -140,7 +168,8 @@ def create_places_post_request(lat, lon, cat):
             "places.rating,"
             "places.types,"
             "places.userRatingCount,"
-            "places.formattedAddress"
+            "places.formattedAddress,"
+            "nextPageToken"
         )
     }
 
@@ -168,7 +197,7 @@ def make_request(url, params={}):
         API return with data and status.
     """
 
-    res = requests.get(url, params = params)
+    res = get_places_client().request(url, params=params)
     results = json.loads(res.content)
     return results
 
@@ -201,59 +230,16 @@ def create_message_request(results):
 
     return return_message
 
-def treat_data_request(df):
+def export_data_request(collector):
     """
-    Performs a treatment on the data, eliminating the json format of the location field and 
-    making aggregations to keep only single establishments.
+    Saves the deduplicated establishments of a run, and the duplicate
+    statistics of its grid cells, in csv files. The establishments are also
+    saved in Parquet when it is enabled.
 
     Parameters
     ----------
-    df: pandas.core.frame.DataFrame
-        The data to be processed.
-
-    Raises
-    ------
-    No Raises.
-
-    Returns
-    -------
-    pandas.core.frame.DataFrame
-        The processed data.
-    """
-    
-    df['geometry'] = df['geometry'].astype(str)
-    df_estab_cat = df.groupby('place_id')[['geometry', 'category']].agg(['unique'])
-
-    lat = []
-    lon = []
-    for coordinates in df_estab_cat['geometry']['unique']:
-        coordinates_numbers = [float(s) for s in re.findall(r'-?\d+\.?\d*', str(coordinates))]
-        lat.append(coordinates_numbers[0])
-        lon.append(coordinates_numbers[1])
-    df_estab_cat['lat'] = lat
-    df_estab_cat['lon'] = lon
-
-    df_estab_cat.columns = ['_'.join(col) for col in df_estab_cat.columns]
-    df_estab_cat.reset_index(inplace=True)
-    df_estab_cat.rename(columns={'category_unique': 'categories', 'lat_': 'lat', 'lon_': 'lon', 'place_id_': 'place_id'}, inplace=True)
-
-    df_place_id = df.drop_duplicates(subset="place_id").copy()
-    df_place_id.drop(columns=['geometry', 'opening_hours', 'category'], inplace=True)
-    df_final = df_estab_cat.merge(df_place_id, on='place_id', how='left')
-    df_final.drop(columns=['geometry_unique'], inplace=True)
-
-    return df_final
-
-def export_data_request(establishments_features_labels, establishments_features_data):
-    """
-    Create dataframe, performs data processing and save data in csv file.
-
-    Parameters
-    ----------
-    establishments_features_labels: list
-        A list of strings with column names from the csv file.
-    establishments_features_data: list
-        A list of lists, each containing data from one of the fields in the csv file.
+    collector: PlaceCollector
+        The establishments collected by the run.
 
     Raises
     ------
@@ -264,12 +250,12 @@ def export_data_request(establishments_features_labels, establishments_features_
     No Returns.
     """
 
-    df_raw = pd.DataFrame()
-    for feature_index in range(len(establishments_features_data)):
-        df_raw[establishments_features_labels[feature_index]] = establishments_features_data[feature_index]
-
-    df_trusted = treat_data_request(df_raw)
-    df_trusted.to_csv('./static/data/output/establishments.csv', index=False)
+    df_establishments = collector.to_frame()
+    # Same text as in the csv, so both files are read back the same way
+    df_establishments['categories'] = df_establishments['categories'].map(str)
+    write_dataset(df_establishments, './static/data/output/establishments.csv')
+    os.makedirs(os.path.dirname(CELL_REPORT_PATH), exist_ok=True)
+    collector.cell_report().to_csv(CELL_REPORT_PATH, sep=';', index=False)
 
 def delete_cat_google(categories_google):
     """
@@ -373,39 +359,129 @@ def create_estab_phrase(df_estab):
         The phrases of the establishments with their respective ID.
     """
 
-    warnings.simplefilter(action='ignore', category=SettingWithCopyWarning)
-
-    df_categories_estab = df_estab[['place_id', 'categories', 'types']]
-    df_categories_estab['types_list'] = df_categories_estab['types'].apply(lambda types: convert_string_to_list(types, ','))
-    df_categories_estab['categories_google'] = df_categories_estab['types_list'].apply(lambda types_list: delete_cat_google(types_list))
-    df_categories_estab['categories_enrichment'] = df_categories_estab['categories'].apply(lambda categories: convert_string_to_list(categories, '\' '))
-
-    place_id = []
-    phrase_list = []
-    category_list = []
-
-    for row in df_categories_estab.iterrows():
-        for cat_enrich in row[1]['categories_enrichment']:
-            phrase = cat_enrich
-            for cat_google in row[1]['categories_google']:
-                phrase = phrase + ' ' + cat_google
-            place_id.append(row[1]['place_id'])
-            phrase_list.append(phrase)
-            category_list.append(cat_enrich)
-    
-    df_categories_estab_phrases = pd.DataFrame()
-    df_categories_estab_phrases['place_id'] = place_id
-    df_categories_estab_phrases['category'] = category_list
-    df_categories_estab_phrases['phrase_establishment'] = phrase_list
-    df_categories_estab_phrases['phrase_establishment'] = df_categories_estab_phrases['phrase_establishment'].apply(lambda phrase: phrase.replace(',', ''))
+    df_categories_estab = df_estab[['place_id', 'categories', 'types']].reset_index(drop=True)
+
+    # Google categories of each establishment, joined in a single string
+    categories_google = _split_categories(df_categories_estab['types'], ',')
+    categories_google = categories_google[~categories_google.isin(['point_of_interest', 'establishment'])]
+    phrases_google = _join_by_row(categories_google)
+
+    # One phrase per enrichment category, followed by all the Google categories
+    categories_enrichment = _split_categories(df_categories_estab['categories'], '\' ')
+    suffix = (' ' + phrases_google.reindex(categories_enrichment.index)).fillna('')
+    phrases = (categories_enrichment + suffix).str.replace(',', '', regex=False)
+
+    df_categories_estab_phrases = pd.DataFrame({
+        'place_id': df_categories_estab['place_id'].reindex(categories_enrichment.index).to_numpy(),
+        'category': categories_enrichment.to_numpy(),
+        'phrase_establishment': phrases.to_numpy(),
+    })
 
     return df_categories_estab_phrases
 
-def calculate_similarity_sentences(sentences_estab, sentences_yelp):
+def intern_estab_phrases(df_estab):
+    """
+    Creates the phrases of the establishments like create_estab_phrase, but
+    builds them only once per distinct (categories, types) combination and
+    maps each unique phrase to an integer id.
+
+    Establishments sharing the same categories and Google types get the same
+    phrases, so the phrase building, and the encoding done on the unique
+    phrases, scale with the diversity of the phrases instead of the number of rows.
+
+    Parameters
+    ----------
+    df_estab: pandas.core.frame.DataFrame
+        The property data obtained from the Google places API.
+
+    Raises
+    ------
+    No Raises.
+
+    Returns
+    -------
+    pandas.core.frame.DataFrame, numpy.ndarray
+        The phrases of the establishments, as returned by create_estab_phrase
+        plus their phrase_id, and the unique phrases indexed by phrase_id.
+    """
+
+    df_categories_estab = df_estab[['place_id', 'categories', 'types']].reset_index(drop=True)
+    combo_ids = df_categories_estab.groupby(['categories', 'types'], sort=False, dropna=False).ngroup().to_numpy()
+    first_rows = np.unique(combo_ids, return_index=True)[1]
+
+    # Phrases of every distinct combination, identified by the combination id
+    df_combos = df_categories_estab.iloc[first_rows].assign(place_id=np.arange(len(first_rows)))
+    df_combo_phrases = create_estab_phrase(df_combos)
+    phrase_ids, unique_phrases = pd.factorize(df_combo_phrases['phrase_establishment'])
+    df_combo_phrases['phrase_id'] = phrase_ids
+
+    # Broadcast to the establishments, keeping the row order of create_estab_phrase
+    counts = np.bincount(df_combo_phrases['place_id'].to_numpy(), minlength=len(first_rows))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    repeats = counts[combo_ids]
+    positions = np.repeat(starts[combo_ids] - np.cumsum(repeats) + repeats, repeats) + np.arange(repeats.sum())
+    df_estab_phrases = df_combo_phrases.iloc[positions].reset_index(drop=True)
+    df_estab_phrases['place_id'] = np.repeat(df_categories_estab['place_id'].to_numpy(), repeats)
+
+    return df_estab_phrases, np.asarray(unique_phrases, dtype=object)
+
+def _join_by_row(items):
+    # Same as items.groupby(level=0).agg(' '.join), for items already grouped by row
+    rows = items.index.to_numpy()
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.array([], dtype=np.int64)
+    ends = np.r_[starts[1:], len(rows)].astype(np.int64)
+    values = items.tolist()
+    return pd.Series([' '.join(values[start:end]) for start, end in zip(starts, ends)],
+                     index=rows[starts], dtype=object)
+
+_LIST_CHARACTERS = str.maketrans('', '', '\'[]')
+
+def _split_categories(texts, sep):
+    # Vectorized convert_string_to_list, one row per item, indexed by the row of its text
+    items = texts.dropna().astype(str).str.split(sep, regex=False).explode()
+    return items.str.translate(_LIST_CHARACTERS).str.strip()
+
+def top_k_similarities(cosine_scores, top_k=None):
+    """
+    Selects the best scored Yelp sentences of every establishment sentence.
+
+    Parameters
+    ----------
+    cosine_scores: torch.Tensor
+        The N x M similarity matrix between establishment and Yelp sentences.
+    top_k: int
+        Number of Yelp sentences kept per establishment sentence, all of them when None or 0.
+
+    Raises
+    ------
+    No Raises.
+
+    Returns
+    -------
+    numpy.ndarray, numpy.ndarray
+        The N x k indices of the Yelp sentences and their scores, by descending score.
+    """
+
+    columns = cosine_scores.shape[1]
+    k = min(top_k, columns) if top_k else columns
+    if k == columns:
+        # Stable sort, ties keep the order of the Yelp sentences
+        scores, indices = torch.sort(cosine_scores, dim=1, descending=True, stable=True)
+    else:
+        scores, indices = torch.topk(cosine_scores, k, dim=1)
+    return indices.cpu().numpy(), scores.cpu().numpy()
+
+def calculate_similarity_sentences(sentences_estab, sentences_yelp, top_k=None, job=None):
     """
     Calculates the semantic textual similarity between the Yelp sentences and the establishments sentences, 
-    using a Sentence Transformer model to generate the embeddings and the cosine similarity to calculate the distance between the vectors.
-    Returns for each establishment sentence all Yelp sentences sorted by score (descending).
+    using the shared Sentence Transformer model (MODEL_NAME, run by MODEL_BACKEND) to generate the embeddings and the cosine similarity to calculate the distance between the vectors.
+    Returns for each establishment sentence the MATCH_TOP_K best Yelp sentences sorted by score (descending).
+    The establishment sentences are matched in batches of MATCH_BATCH_SIZE, so memory does not grow
+    with the full N x M similarity matrix. With ANN_ENABLED and at least ANN_MIN_CATEGORIES
+    Yelp sentences, the top-k is searched in an approximate IVF index probing ANN_PROBES clusters
+    instead of scoring every Yelp sentence. The embeddings of the Yelp sentences are reused from the on-disk EmbeddingStore
+    when EMBEDDING_CACHE_ENABLED is set. A background job is advanced by the number of establishment
+    sentences of every batch, and checked for cancellation between batches.
     
     Parameters
     ----------
@@ -413,25 +489,117 @@ def calculate_similarity_sentences(sentences_estab, sentences_yelp):
         The establishments sentences.
     sentences_yelp: pandas.core.series.Series
         The Yelp sentences.
+    top_k: int
+        Number of Yelp sentences kept per establishment sentence, defaults to
+        MATCH_TOP_K; 0 keeps all of them.
+    job: jobs.Job
+        Optional background job running the matching.
+
+    Raises
+    ------
+    jobs.JobCancelled
+        If the job is cancelled before all the batches are matched.
     
     Returns
     -------
     pandas.DataFrame
-        DataFrame with columns: phrase_establishment, phrase_yelp, score, estab_idx, yelp_idx
+        DataFrame with columns: estab_idx, yelp_idx, score
     """
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    embeddings_estab = model.encode(sentences_estab, convert_to_tensor=True)
-    embeddings_yelp = model.encode(sentences_yelp, convert_to_tensor=True)
-    cosine_scores = util.cos_sim(embeddings_estab, embeddings_yelp)
-    rows = len(sentences_estab)
-    columns = len(sentences_yelp)
-    data = []
-    for i in range(rows):
-        pairs = []
-        for j in range(columns):
-            pairs.append({'estab_idx': i, 'yelp_idx': j, 'score': float(cosine_scores[i][j])})
-        pairs_sorted = sorted(pairs, key=lambda x: x['score'], reverse=True)
-        data.extend(pairs_sorted)
-    df_score = pd.DataFrame(data)
+    if top_k is None:
+        top_k = int(get_config_value("MATCH_TOP_K") or 0)
+    batch_size = max(1, int(get_config_value("MATCH_BATCH_SIZE")))
+    model = get_sentence_model()
+    sentences_yelp = list(sentences_yelp)
+    if get_config_value("EMBEDDING_CACHE_ENABLED"):
+        embeddings_yelp = torch.from_numpy(get_embedding_store().encode(sentences_yelp, model))
+    else:
+        embeddings_yelp = model.encode(sentences_yelp, convert_to_tensor=True)
+    embeddings_yelp = util.normalize_embeddings(embeddings_yelp.to(model.device))
+
+    index = None
+    if (top_k and get_config_value("ANN_ENABLED")
+            and len(embeddings_yelp) >= int(get_config_value("ANN_MIN_CATEGORIES"))):
+        fingerprint = phrases_fingerprint(model_key(), sentences_yelp)
+        index = get_ann_index(fingerprint, embeddings_yelp.cpu().numpy(), n_lists=int(get_config_value("ANN_LISTS")))
+        n_probe = int(get_config_value("ANN_PROBES"))
+
+    # The establishment sentences are encoded and scored MATCH_BATCH_SIZE at a time,
+    # so only a batch x M block of scores exists at once.
+    sentences_estab = list(sentences_estab)
+    k = min(top_k, len(embeddings_yelp)) if top_k else len(embeddings_yelp)
+    indices = np.empty((len(sentences_estab), k), dtype=np.int64)
+    scores = np.empty((len(sentences_estab), k), dtype=np.float32)
+    if job is not None:
+        job.add_total(len(sentences_estab))
+    for start in range(0, len(sentences_estab), batch_size):
+        if job is not None:
+            job.check_cancelled()
+        batch = sentences_estab[start:start + batch_size]
+        embeddings_estab = util.normalize_embeddings(model.encode(batch, convert_to_tensor=True))
+        if index is not None:
+            block = index.search(embeddings_estab.cpu().numpy(), k, n_probe)
+        else:
+            block = top_k_similarities(embeddings_estab @ embeddings_yelp.T, k)
+        indices[start:start + len(batch)], scores[start:start + len(batch)] = block
+        if job is not None:
+            job.advance(len(batch))
+
+    df_score = pd.DataFrame({
+        'estab_idx': np.repeat(np.arange(indices.shape[0]), indices.shape[1]),
+        'yelp_idx': indices.ravel(),
+        'score': scores.ravel().astype(np.float64),
+    })
 
     return df_score
+
+def build_establishment_phrases(estab_categories, estab_phrases, sim_df):
+    """
+    Assembles the matching options of every establishment phrase in a single pass over the scores.
+
+    Parameters
+    ----------
+    estab_categories: list
+        The category of each establishment phrase.
+    estab_phrases: list
+        The establishment phrases.
+    sim_df: pandas.DataFrame
+        The scores returned by calculate_similarity_sentences.
+
+    Raises
+    ------
+    No Raises.
+
+    Returns
+    -------
+    list
+        One dict per establishment phrase, with its options sorted by descending score.
+    """
+
+    estab_idx = sim_df['estab_idx'].to_numpy(dtype=np.int64)
+    yelp_idx = sim_df['yelp_idx'].to_numpy(dtype=np.int64)
+    scores = sim_df['score'].to_numpy(dtype=np.float64)
+    scores = np.where(np.isfinite(scores), scores, -1.0)
+
+    # Groups the scores by establishment, by descending score (ties keep their order)
+    order = np.lexsort((-scores, estab_idx))
+    estab_idx, yelp_idx, scores = estab_idx[order], yelp_idx[order], scores[order]
+    bounds = np.searchsorted(estab_idx, np.arange(len(estab_phrases) + 1))
+    yelp_idx, scores = yelp_idx.tolist(), scores.tolist()
+
+    establishment_phrases = []
+    for index, (category, phrase) in enumerate(zip(estab_categories, estab_phrases)):
+        start, end = bounds[index], bounds[index + 1]
+        options = [
+            {"category_index": category_index, "score": score}
+            for category_index, score in zip(yelp_idx[start:end], scores[start:end])
+        ]
+        best_score = options[0]['score'] if options else -1.0
+        establishment_phrases.append({
+            "category": category,
+            "phrase": phrase,
+            "best_score": best_score,
+            "selected_score": best_score,
+            "selected_option": 0 if options else None,
+            "options": options
+        })
+    return establishment_phrases
@@ -1,4 +1,8 @@
 from google_places_enricher_2_0.app import app
+from google_places_enricher_2_0.config import get_config_value
+from google_places_enricher_2_0.models import warm_up_model
 
 if __name__ == "__main__":
+    if get_config_value("MODEL_WARM_UP"):
+        warm_up_model()
     app.run()
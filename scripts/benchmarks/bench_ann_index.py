@@ -0,0 +1,75 @@
+"""
+Reports the recall@k and query time of the IVF category index
+(google_places_enricher_2_0.ann_index) against an exact top-k search, on
+synthetic clustered embeddings shaped like a large category taxonomy.
+
+Usage (from the repository root):
+    python scripts/benchmarks/bench_ann_index.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from google_places_enricher_2_0.ann_index import IVFIndex, normalize
+
+CATEGORIES = 50000
+QUERIES = 2000
+DIMENSION = 384
+TOPICS = 400
+K = 20
+PROBES = [1, 2, 4, 8, 16, 32]
+
+
+def clustered_embeddings(n, seed):
+    # Phrases gathered around topics, like sentence embeddings of a taxonomy
+    rng = np.random.default_rng(0)
+    topics = rng.normal(size=(TOPICS, DIMENSION))
+    rng = np.random.default_rng(seed)
+    return normalize(topics[rng.integers(0, TOPICS, n)] + 1.2 * rng.normal(size=(n, DIMENSION)))
+
+
+def exact_search(queries, vectors, k, block=512):
+    indices = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), block):
+        scores = queries[start:start + block] @ vectors.T
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1)
+        indices[start:start + block] = np.take_along_axis(best, order, axis=1)
+    return indices
+
+
+def recall_at_k(found, exact):
+    return np.mean([len(set(a) & set(b)) / exact.shape[1] for a, b in zip(found, exact)])
+
+
+def main():
+    vectors = clustered_embeddings(CATEGORIES, seed=1)
+    queries = clustered_embeddings(QUERIES, seed=2)
+
+    start = time.perf_counter()
+    exact = exact_search(queries, vectors, K)
+    exact_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = IVFIndex.build(vectors)
+    build_time = time.perf_counter() - start
+    index.search(queries[:10], K)
+
+    print(f"{CATEGORIES} categories, {QUERIES} queries, k={K}, {len(index.centroids)} lists "
+          f"(built in {build_time:.1f}s)")
+    print(f"{'search':<14}{'recall@k':>10}{'time (s)':>10}{'speedup':>9}")
+    print(f"{'exact':<14}{1.0:>10.3f}{exact_time:>10.3f}{1.0:>8.1f}x")
+    for n_probe in PROBES:
+        start = time.perf_counter()
+        found, _ = index.search(queries, K, n_probe=n_probe)
+        elapsed = time.perf_counter() - start
+        print(f"{'n_probe=%d' % n_probe:<14}{recall_at_k(found, exact):>10.3f}{elapsed:>10.3f}"
+              f"{exact_time / elapsed:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compares the scalar grid generation calculate_coordinates used to do with the
+vectorized google_places_enricher_2_0.grid.square_grid on large bounding boxes.
+
+Usage (from the repository root):
+    python scripts/benchmarks/bench_calculate_coordinates.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pyproj
+import shapely.geometry
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from google_places_enricher_2_0.grid import square_grid, write_coordinates
+
+BOXES = {
+    "Curitiba, r=4444m": (4444, -25.512242704374355, -49.32304693059921, -25.329914975179992, -49.20322728948593),
+    "Curitiba, r=100m": (100, -25.512242704374355, -49.32304693059921, -25.329914975179992, -49.20322728948593),
+    "Sao Paulo metro, r=200m": (200, -23.80, -46.85, -23.35, -46.35),
+    "Sao Paulo metro, r=100m": (100, -23.80, -46.85, -23.35, -46.35),
+}
+
+
+def legacy_grid(path, radius, southwest_lat, southwest_lon, northeast_lat, northeast_lon):
+    to_proxy_transformer = pyproj.Transformer.from_crs("epsg:4326", "epsg:3857")
+    to_original_transformer = pyproj.Transformer.from_crs("epsg:3857", "epsg:4326")
+    sw = shapely.geometry.Point(southwest_lat, southwest_lon)
+    ne = shapely.geometry.Point(northeast_lat, northeast_lon)
+    stepsize = radius + (radius / 2)
+    transformed_sw = to_proxy_transformer.transform(sw.x, sw.y)
+    transformed_ne = to_proxy_transformer.transform(ne.x, ne.y)
+    gridpoints = []
+    x = transformed_sw[0] + (3 / 4 * radius)
+    while x < transformed_ne[0]:
+        y = transformed_sw[1] + (3 / 4 * radius)
+        while y < transformed_ne[1]:
+            gridpoints.append(shapely.geometry.Point(to_original_transformer.transform(x, y)))
+            y += stepsize
+        x += stepsize
+    with open(path, "w") as of:
+        of.write("lat;lon\n")
+        for p in gridpoints:
+            of.write("{:f};{:f}\n".format(p.x, p.y))
+    return len(gridpoints)
+
+
+def vectorized_grid(path, *box):
+    lats, lons = square_grid(*box)
+    write_coordinates(path, lats, lons)
+    return len(lats)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.csv")
+        vectorized_path = os.path.join(tmp, "vectorized.csv")
+        print(f"{'area':<26}{'points':>10}{'legacy (s)':>12}{'vectorized (s)':>16}{'speedup':>9}  identical")
+        for name, box in BOXES.items():
+            points, legacy_time = timed(legacy_grid, legacy_path, *box)
+            _, vectorized_time = timed(vectorized_grid, vectorized_path, *box)
+            with open(legacy_path) as a, open(vectorized_path) as b:
+                identical = a.read() == b.read()
+            print(f"{name:<26}{points:>10}{legacy_time:>12.3f}{vectorized_time:>16.3f}"
+                  f"{legacy_time / vectorized_time:>8.1f}x  {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Compares the per-establishment filtering get_categories_to_match used to do
+on the score frame with google_places_enricher_2_0.utils.build_establishment_phrases,
+for a growing number of establishment phrases. The time per phrase of the
+single pass stays flat while the old loop grows with the number of phrases.
+
+Usage (from the repository root):
+    python scripts/benchmarks/bench_categories_to_match.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from google_places_enricher_2_0.utils import build_establishment_phrases
+
+CATEGORIES = 1500
+TOP_K = 20
+SIZES = [250, 500, 1000, 2000, 4000]
+
+
+def synthetic_scores(phrases, seed=0):
+    rng = np.random.default_rng(seed)
+    scores = -np.sort(-rng.random((phrases, TOP_K)), axis=1)
+    return pd.DataFrame({
+        "estab_idx": np.repeat(np.arange(phrases), TOP_K),
+        "yelp_idx": rng.integers(0, CATEGORIES, phrases * TOP_K),
+        "score": scores.ravel(),
+    })
+
+
+def legacy_assembly(estab_categories, estab_phrases, sim_df):
+    establishment_phrases = []
+    for estab_idx, (category, phrase) in enumerate(zip(estab_categories, estab_phrases)):
+        matches = sim_df[sim_df.estab_idx == estab_idx]
+        options = []
+        for row in matches.itertuples(index=False):
+            score = float(row.score)
+            if not pd.notnull(score) or not np.isfinite(score):
+                score = -1.0
+            options.append({"category_index": int(row.yelp_idx), "score": score})
+        options_sorted = sorted(options, key=lambda x: x['score'], reverse=True)
+        best_score = options_sorted[0]['score'] if options_sorted else -1.0
+        selected_option = 0 if options_sorted else None
+        selected_score = options_sorted[0]['score'] if options_sorted else -1.0
+        establishment_phrases.append({
+            "category": category,
+            "phrase": phrase,
+            "best_score": best_score,
+            "selected_score": selected_score,
+            "selected_option": selected_option,
+            "options": options_sorted
+        })
+    return establishment_phrases
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    print(f"{'phrases':>8}{'legacy (s)':>12}{'us/phrase':>11}{'single pass (s)':>17}{'us/phrase':>11}  identical")
+    for size in SIZES:
+        sim_df = synthetic_scores(size)
+        phrases = [f"phrase {i}" for i in range(size)]
+        categories = [f"cat{i % 7}" for i in range(size)]
+        legacy, legacy_time = timed(legacy_assembly, categories, phrases, sim_df)
+        single, single_time = timed(build_establishment_phrases, categories, phrases, sim_df)
+        print(f"{size:>8}{legacy_time:>12.3f}{legacy_time / size * 1e6:>11.0f}"
+              f"{single_time:>17.4f}{single_time / size * 1e6:>11.1f}  {legacy == single}")
+
+
+if __name__ == "__main__":
+    main()
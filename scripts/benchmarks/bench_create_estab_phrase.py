@@ -0,0 +1,88 @@
+"""
+Compares the row by row create_estab_phrase (apply + iterrows and string
+concatenation) with the vectorized google_places_enricher_2_0.utils.create_estab_phrase
+on 100k synthetic establishments.
+
+Usage (from the repository root):
+    python scripts/benchmarks/bench_create_estab_phrase.py
+"""
+import os
+import random
+import sys
+import time
+import warnings
+
+import pandas as pd
+from pandas.errors import SettingWithCopyWarning
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from google_places_enricher_2_0.utils import convert_string_to_list, create_estab_phrase, delete_cat_google
+
+ESTABLISHMENTS = 100000
+TYPES = ["bakery", "store", "food", "cafe", "restaurant", "bar", "meal_takeaway", "point_of_interest",
+         "establishment", "night_club", "grocery_or_supermarket", "liquor_store"]
+CATEGORIES = ["bakery", "cafe", "bar", "coffee shop", "pizza", "Italian", "brewery, pub"]
+
+
+def synthetic_establishments(seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(ESTABLISHMENTS):
+        categories = rng.sample(CATEGORIES, rng.randint(1, 3))
+        rows.append({
+            "place_id": f"place-{i}",
+            "categories": "[" + " ".join(f"'{c}'" for c in categories) + "]",
+            "types": ", ".join(rng.sample(TYPES, rng.randint(1, 5))),
+        })
+    return pd.DataFrame(rows)
+
+
+def legacy_create_estab_phrase(df_estab):
+    warnings.simplefilter(action='ignore', category=SettingWithCopyWarning)
+
+    df_categories_estab = df_estab[['place_id', 'categories', 'types']]
+    df_categories_estab['types_list'] = df_categories_estab['types'].apply(lambda types: convert_string_to_list(types, ','))
+    df_categories_estab['categories_google'] = df_categories_estab['types_list'].apply(lambda types_list: delete_cat_google(types_list))
+    df_categories_estab['categories_enrichment'] = df_categories_estab['categories'].apply(lambda categories: convert_string_to_list(categories, '\' '))
+
+    place_id = []
+    phrase_list = []
+    category_list = []
+
+    for row in df_categories_estab.iterrows():
+        for cat_enrich in row[1]['categories_enrichment']:
+            phrase = cat_enrich
+            for cat_google in row[1]['categories_google']:
+                phrase = phrase + ' ' + cat_google
+            place_id.append(row[1]['place_id'])
+            phrase_list.append(phrase)
+            category_list.append(cat_enrich)
+
+    df_categories_estab_phrases = pd.DataFrame()
+    df_categories_estab_phrases['place_id'] = place_id
+    df_categories_estab_phrases['category'] = category_list
+    df_categories_estab_phrases['phrase_establishment'] = phrase_list
+    df_categories_estab_phrases['phrase_establishment'] = df_categories_estab_phrases['phrase_establishment'].apply(lambda phrase: phrase.replace(',', ''))
+
+    return df_categories_estab_phrases
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    df = synthetic_establishments()
+    legacy, legacy_time = timed(legacy_create_estab_phrase, df.copy())
+    vectorized, vectorized_time = timed(create_estab_phrase, df.copy())
+    pd.testing.assert_frame_equal(legacy, vectorized)
+    print(f"{ESTABLISHMENTS} establishments, {len(vectorized)} phrases, identical frames")
+    print(f"row by row: {legacy_time:.3f}s")
+    print(f"vectorized: {vectorized_time:.3f}s ({legacy_time / vectorized_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Compares the inference backends of the phrase encoder
+(google_places_enricher_2_0.models.BACKENDS) on CPU:
+
+* accuracy: the establishment phrases of static/data/input/category_matches.json
+  are matched again against its Yelp phrases, and the scores are compared with
+  the ones stored in the file (computed with the PyTorch model);
+* throughput: sentences encoded per second on the enrichment phrases.
+
+Backends whose packages are missing are skipped.
+
+Usage (from the repository root):
+    python scripts/benchmarks/bench_encoder_backends.py [backend ...]
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# The model runs on CPU, as on the desktops the app is shipped to
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+from google_places_enricher_2_0.models import BACKENDS, get_sentence_model
+
+INPUT_DIR = os.path.join(ROOT, "google_places_enricher_2_0", "static", "data", "input")
+THROUGHPUT_SENTENCES = 3000
+TOP_K = 10
+
+
+def reference_scores():
+    with open(os.path.join(INPUT_DIR, "category_matches.json"), encoding="utf-8") as f:
+        reference = json.load(f)
+    scores = np.full((len(reference["phrases_arr"]), len(reference["categories_arr"])), np.nan)
+    for match in reference["matches"]:
+        for option in match["match_options"]:
+            scores[match["phrase_idx"], option["yelp_idx"]] = option["score"]
+    return reference["phrases_arr"], reference["categories_arr"], scores
+
+
+def cosine_scores(model, phrases, categories):
+    a = model.encode(phrases, convert_to_numpy=True, normalize_embeddings=True)
+    b = model.encode(categories, convert_to_numpy=True, normalize_embeddings=True)
+    return a @ b.T
+
+
+def accuracy(scores, expected):
+    known = ~np.isnan(expected)
+    errors = np.abs(scores - expected)[known]
+    top_1 = np.mean(np.argmax(scores, axis=1) == np.argmax(np.nan_to_num(expected, nan=-2), axis=1))
+    overlap = np.mean([
+        len(set(np.argsort(-s)[:TOP_K]) & set(np.argsort(-np.nan_to_num(e, nan=-2))[:TOP_K])) / TOP_K
+        for s, e in zip(scores, expected)
+    ])
+    return errors.max(), errors.mean(), top_1, overlap
+
+
+def throughput(model, sentences):
+    model.encode(sentences[:64])
+    start = time.perf_counter()
+    model.encode(sentences, batch_size=64)
+    return len(sentences) / (time.perf_counter() - start)
+
+
+def main(backends):
+    phrases, categories, expected = reference_scores()
+    enrichment = pd.read_csv(os.path.join(INPUT_DIR, "enrichment_categories.csv"), delimiter=";")
+    sentences = enrichment["matching_phrase"].astype(str).tolist()
+    sentences = (sentences * (THROUGHPUT_SENTENCES // len(sentences) + 1))[:THROUGHPUT_SENTENCES]
+
+    print(f"{'backend':<12}{'max |err|':>11}{'mean |err|':>12}{'top-1':>8}{'top-%d' % TOP_K:>8}{'sent/s':>10}")
+    for backend in backends:
+        try:
+            model = get_sentence_model(backend=backend)
+        except Exception as e:
+            print(f"{backend:<12}skipped: {e}")
+            continue
+        max_error, mean_error, top_1, overlap = accuracy(cosine_scores(model, phrases, categories), expected)
+        rate = throughput(model, sentences)
+        print(f"{backend:<12}{max_error:>11.4f}{mean_error:>12.4f}{top_1:>8.2f}{overlap:>8.2f}{rate:>10.0f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or list(BACKENDS))
@@ -0,0 +1,117 @@
+"""
+Compares the per-label if/elif parsing request_google_places used to do,
+followed by a column-by-column DataFrame (with the location still formatted
+as a "lat, lon" string), with the field extractor table of
+google_places_enricher_2_0.utils.extract_establishment_rows on a large
+synthetic set of Google Places responses.
+
+Usage (from the repository root):
+    python scripts/benchmarks/bench_record_builder.py
+"""
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from google_places_enricher_2_0.utils import ESTABLISHMENT_LABELS, extract_establishment_rows
+
+LEGACY_LABELS = [
+    "business_status", "geometry", "name", "opening_hours", "place_id", "price_level",
+    "rating", "types", "user_ratings_total", "vicinity", "category",
+]
+RESPONSES = 5000
+PLACES_PER_RESPONSE = 20
+
+
+def synthetic_responses(seed=0):
+    rng = random.Random(seed)
+    responses = []
+    for r in range(RESPONSES):
+        places = []
+        for p in range(PLACES_PER_RESPONSE):
+            place = {
+                "id": f"place-{r}-{p}",
+                "displayName": {"text": f"Establishment {r}-{p}"},
+                "businessStatus": "OPERATIONAL",
+                "location": {"latitude": rng.uniform(-26, -25), "longitude": rng.uniform(-50, -49)},
+                "types": rng.sample(["store", "food", "bakery", "cafe", "point_of_interest"], 3),
+                "formattedAddress": f"Rua {p}, {r}",
+            }
+            if rng.random() < 0.7:
+                place["rating"] = round(rng.uniform(1, 5), 1)
+                place["userRatingCount"] = rng.randint(1, 500)
+            places.append(place)
+        responses.append(("cat%d" % (r % 10), {"places": places}))
+    return responses
+
+
+def legacy_builder(responses):
+    labels = LEGACY_LABELS
+    data = [[] for _ in labels]
+    for cat, response in responses:
+        for establishment in response["places"]:
+            for feature_index, label in enumerate(labels):
+                try:
+                    if label == "business_status":
+                        value = establishment.get("businessStatus")
+                    elif label == "geometry":
+                        location = establishment.get("location", {})
+                        value = f"{location.get('latitude')}, {location.get('longitude')}"
+                    elif label == "name":
+                        value = establishment.get("displayName", {}).get("text")
+                    elif label == "place_id":
+                        value = establishment.get("id")
+                    elif label == "price_level":
+                        value = establishment.get("priceLevel")
+                    elif label == "rating":
+                        value = establishment.get("rating")
+                    elif label == "types":
+                        value = ", ".join(establishment.get("types", []))
+                    elif label == "user_ratings_total":
+                        value = establishment.get("userRatingCount")
+                    elif label == "vicinity":
+                        value = establishment.get("formattedAddress")
+                    elif label == "category":
+                        value = cat
+                    else:
+                        value = None
+                    data[feature_index].append(value)
+                except Exception:
+                    data[feature_index].append(None)
+    df = pd.DataFrame()
+    for feature_index in range(len(data)):
+        df[labels[feature_index]] = data[feature_index]
+    return df
+
+
+def table_builder(responses):
+    rows = []
+    for cat, response in responses:
+        rows.extend(extract_establishment_rows(response["places"], cat))
+    return pd.DataFrame.from_records(rows, columns=ESTABLISHMENT_LABELS)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    responses = synthetic_responses()
+    legacy, legacy_time = timed(legacy_builder, responses)
+    table, table_time = timed(table_builder, responses)
+    geometry = table["lat"].astype(str) + ", " + table["lon"].astype(str)
+    assert (legacy.pop("geometry") == geometry).all()
+    pd.testing.assert_frame_equal(legacy, table.drop(columns=["lat", "lon"]))
+    print(f"{len(table)} establishments, identical fields")
+    print(f"legacy if/elif: {legacy_time:.3f}s")
+    print(f"extractor table: {table_time:.3f}s ({legacy_time / table_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()